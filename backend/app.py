@@ -1,17 +1,56 @@
-from mastodon import Mastodon
+from mastodon import Mastodon, MastodonNetworkError, MastodonServerError, MastodonError
 from fastapi import FastAPI, HTTPException, Request, Query
-from fastapi.responses import RedirectResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, RedirectResponse, StreamingResponse
 from dotenv import load_dotenv
 import os
 from fastapi.middleware.cors import CORSMiddleware
 import httpx
 from auth import AuthHandler
-from models.Recommender import Recommender
-import numpy as np
+from models.Registry import registry
+from src.recommendation_worker import RecommendationWorker
+from src.executors import Saturated, io_executor, inference_executor
+from src.serialization import dumps, json_response
+from utils.statuses import slim_statuses
+from src.sessions import Session, SessionManager
+from utils.metrics import metrics
+from utils.memory import current_rss_bytes
+from contextlib import asynccontextmanager
+import logging
+import asyncio
+import threading
 
 load_dotenv()
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "WARNING").upper(),
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+)
+
+metrics.gauge("mastoradar_rss_bytes", current_rss_bytes, "Resident memory of the process")
+metrics.gauge("mastoradar_io_executor_pending", lambda: io_executor.pending, "Jobs queued or running on the I/O executor")
+metrics.gauge(
+    "mastoradar_inference_executor_pending", lambda: inference_executor.pending,
+    "Jobs queued or running on the inference executor",
+)
+metrics.gauge(
+    "mastoradar_embedding_store_entries", lambda: registry.stats()["embedding_store_entries"],
+    "Embeddings persisted in the embedding store",
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load CLIP and spaCy once per process so requests never pay for model loading
+    if os.getenv("MODEL_WARMUP", "1") != "0":
+        registry.warm_up()
+    recommendation_worker.start()
+    yield
+    recommendation_worker.stop()
+    sessions.evict(force=True)
+    io_executor.shutdown()
+    inference_executor.shutdown()
 
-app = FastAPI()
+
+app = FastAPI(lifespan=lifespan)
 auth_handler = AuthHandler()
 
 app.add_middleware(
@@ -20,53 +59,150 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],  # Allow all HTTP methods (GET, POST, OPTIONS, etc.)
     allow_headers=["*"],  # Allow all headers
+    expose_headers=["X-Recommendations-Age", "ETag"],
 )
 
-authenticated = False
+@app.exception_handler(Saturated)
+async def saturated_handler(request: Request, exc: Saturated):
+    # Shed load instead of queueing without bound, so cheap endpoints stay responsive
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
 unauthorized_mastodon = Mastodon(
     client_id=os.getenv("MASTODON_CLIENT_ID"),
     client_secret=os.getenv("MASTODON_CLIENT_SECRET"),
     api_base_url=os.getenv("MASTODON_API_BASE_URL")
 )
 
-def numpy_to_python(obj):
+# Precomputes the recommendations of logged-in users in the background
+# Both recommendation kinds are ranked from one shared fetch, embedding and keyword pass
+recommendation_worker = RecommendationWorker({
+    ("similar", "keyword"): lambda session: session.recommend(presets=["similar", "keyword"]),
+})
+
+# One session per access token, so every user keeps their own client, profile and recommendations
+sessions = SessionManager(
+    os.getenv("MASTODON_API_BASE_URL"),
+    on_create=lambda session: recommendation_worker.register(session.key, session),
+    on_evict=lambda session: recommendation_worker.unregister(session.key),
+)
+metrics.gauge("mastoradar_sessions", lambda: len(sessions), "Sessions of logged-in users")
+
+def access_token_from(request: Request):
     """
-    Recursively convert numpy types to Python types for JSON serialization.
+    Read the access token from the Authorization: Bearer header, or the access_token query parameter.
     """
-    if isinstance(obj, (np.integer, np.floating)):
-        return obj.item()  # Converts numpy int/float to Python int/float
-    elif isinstance(obj, np.ndarray):
-        return obj.tolist()  # Converts numpy array to list
-    elif isinstance(obj, dict):
-        return {key: numpy_to_python(value) for key, value in obj.items()}
-    elif isinstance(obj, list):
-        return [numpy_to_python(value) for value in obj]
-    return obj
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() == "bearer" and token.strip():
+        return token.strip()
+    return request.query_params.get("access_token")
 
+async def get_session(request: Request) -> Session:
+    access_token = access_token_from(request)
+    if not access_token:
+        raise HTTPException(status_code=400, detail="Not authenticated")
+    # A new token is verified against the instance before its session is created
+    try:
+        return await io_executor.run(sessions.get, access_token)
+    except (MastodonNetworkError, MastodonServerError):
+        raise HTTPException(status_code=502, detail="Mastodon instance unavailable")
+    except MastodonError:
+        raise HTTPException(status_code=401, detail="Invalid access token")
+
+async def serveRecommendations(kind: str, request: Request):
+    """
+    Serve the current user's cached recommendations, reporting their age in a response header.
+    A cache miss waits for the computation on the inference executor without blocking the event loop.
+    Unchanged recommendations are answered with 304 through their ETag.
+    """
+    session = await get_session(request)
+    try:
+        recommendations, age = await asyncio.wrap_future(recommendation_worker.get(session.key, kind))
+    except Saturated:
+        raise
+    except KeyError:
+        raise HTTPException(status_code=400, detail="Not authenticated")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error generating recommendations: {str(e)}")
+    return json_response(request, recommendations, {"X-Recommendations-Age": f"{age:.0f}"})
 
 @app.get("/")
 def read_root():
     return {"message": "Welcome to Mastodon Recommender API!"}
 
+@app.get("/health")
+def health():
+    """
+    Report model load/warm-up times and the resident memory of the process.
+    """
+    return {"status": "ok", **registry.stats()}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """
+    Expose per-stage timings, cache hit rates and resource gauges in the Prometheus text format.
+    """
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/getRecommendations")
-def getRecommendations():
+async def getRecommendations(request: Request):
     """
     Fetch similar posts based on the user's favorites.
-    :param top_n: Number of recommendations to return.
-    :param limit: Number of public posts to analyze.
     :return: List of recommended posts.
     """
-    try:
-        if authenticated:
-            recommender = Recommender(mastodon)
-            recommendations = recommender.get_similar_posts()
-            safe_recommendations = numpy_to_python(recommendations)
-            print(f"Recommendations: {safe_recommendations}")  # Debugging
-            return safe_recommendations
-        else:
-            raise HTTPException(status_code=400, detail="Not authenticated")
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error generating recommendations: {str(e)}")
+    return await serveRecommendations("similar", request)
+
+@app.get("/streamRecommendations")
+async def streamRecommendations(request: Request, time_budget: float = Query(None, gt=0)):
+    """
+    Stream recommendations as newline-delimited JSON while they are being computed.
+    Every line holds the current top recommendations; the last one has "done": true.
+    These are ranked by CLIP similarity alone and are not cached: /getRecommendations serves the
+    hybrid ranking computed by the recommendation worker.
+    :param time_budget: Seconds after which the best recommendations found so far are final.
+    """
+    session = await get_session(request)
+    loop = asyncio.get_running_loop()
+    lines = asyncio.Queue()
+    disconnected = threading.Event()
+
+    def produce():
+        try:
+            for recommendations, done in session.iter_similar_posts(time_budget=time_budget):
+                line = dumps({"recommendations": recommendations, "done": done})
+                loop.call_soon_threadsafe(lines.put_nowait, line + b"\n")
+                if disconnected.is_set():
+                    break
+        except Exception as e:
+            line = dumps({"error": f"Error generating recommendations: {str(e)}", "done": True})
+            loop.call_soon_threadsafe(lines.put_nowait, line + b"\n")
+        finally:
+            loop.call_soon_threadsafe(lines.put_nowait, None)
+
+    # Admitted before streaming starts, so a saturated executor still answers 503
+    inference_executor.submit(produce)
+
+    async def body():
+        try:
+            while (line := await lines.get()) is not None:
+                yield line
+        finally:
+            disconnected.set()
+
+    return StreamingResponse(body(), media_type="application/x-ndjson")
+
+@app.post("/refreshRecommendations")
+async def refreshRecommendations(request: Request):
+    """
+    Recompute the user's recommendations in the background; the endpoints keep serving
+    the previous results until the new ones are ready.
+    """
+    session = await get_session(request)
+    recommendation_worker.refresh(session.key)
+    return {"message": "Refresh scheduled"}
 
 @app.get("/login")
 def login():
@@ -83,16 +219,10 @@ async def callback(request: Request):
         raise HTTPException(status_code=400, detail="Authorization code not found")
 
     try:
-        access_token = auth_handler.exchange_code_for_token(code)
+        access_token = await io_executor.run(auth_handler.exchange_code_for_token, code)
         # print(f"Access token: {access_token}")  # Debugging
-
-        global mastodon
-        mastodon = Mastodon(
-        access_token=access_token,
-        api_base_url=os.getenv("MASTODON_API_BASE_URL")
-        )
-        global authenticated
-        authenticated = True
+        # Creating the session starts precomputing recommendations before the frontend asks for them
+        await io_executor.run(sessions.get, access_token)
 
         redirect_url = f"http://localhost:5173/authenticated?access_token={access_token}"
         return RedirectResponse(url=redirect_url)
@@ -101,17 +231,9 @@ async def callback(request: Request):
 
 @app.get("/getuser")
 async def getUser(request: Request):
-    access_token = request.query_params.get("access_token")
-    if not access_token:
-        raise HTTPException(status_code=400, detail="Access token is required")
-    global mastodon
-    mastodon = Mastodon(
-        access_token=access_token,
-        api_base_url=os.getenv("MASTODON_API_BASE_URL")
-    )
-    user = mastodon.account_verify_credentials()
-    global authenticated
-    authenticated = True
+    session = await get_session(request)
+    # Cached on the session when its token was verified
+    user = session.account
 
     user_id = user.get("id")
     username = user.get("username")
@@ -125,9 +247,10 @@ async def getUser(request: Request):
     }
 
 @app.post("/logout")
-def logout():
-    global authenticated
-    authenticated = False
+def logout(request: Request):
+    access_token = access_token_from(request)
+    if access_token:
+        sessions.close(access_token)
     return {"message": "Logged out successfully"}
 
 # @app.get("/getPublicTimeline")
@@ -135,43 +258,29 @@ def logout():
 #     return unauthorized_len(mastodon.timeline_public())¨
 
 @app.get("/getExploreTimeline")
-async def getPublicTimeline():
+async def getPublicTimeline(request: Request):
     async with httpx.AsyncClient() as client:
         response = await client.get(
             'https://mastodon.social/api/v1/trends/statuses',
         )
         response.raise_for_status()  # Raise an exception for HTTP errors
-        return response.json()
+        return json_response(request, slim_statuses(response.json()))
 
 @app.get("/getLocalTimeline")
-def getLocalTimeline():
-    return unauthorized_mastodon.timeline_local()
+async def getLocalTimeline(request: Request):
+    statuses = await io_executor.run(unauthorized_mastodon.timeline_local)
+    return json_response(request, slim_statuses(statuses))
 
 @app.get("/getHomeTimeline")
-def getHomeTimeline():
-  if authenticated:
-    return mastodon.timeline_home()
-  else:
-    raise HTTPException(status_code=400, detail="Not authenticated")
+async def getHomeTimeline(request: Request):
+  session = await get_session(request)
+  statuses = await io_executor.run(session.mastodon.timeline_home)
+  return json_response(request, slim_statuses(statuses))
 
 @app.get("/getRecommendedTimeline")
-async def getRecommendedTimeline():
-  if authenticated:
-    async with httpx.AsyncClient(timeout=30.0) as client:
-            recommender = Recommender(mastodon)
-            recommendations = recommender.get_similar_posts()
-            safe_recommendations = numpy_to_python(recommendations)
-            return safe_recommendations
-  else:
-    raise HTTPException(status_code=400, detail="Not authenticated")
+async def getRecommendedTimeline(request: Request):
+  return await serveRecommendations("similar", request)
 
 @app.get("/getRecommendedUltraTimeline")
-async def getRecommendedTimeline():
-  if authenticated:
-    async with httpx.AsyncClient(timeout=30.0) as client:
-            recommender = Recommender(mastodon)
-            recommendations = recommender.KeywordRecommender()
-            safe_recommendations = numpy_to_python(recommendations)
-            return safe_recommendations
-  else:
-    raise HTTPException(status_code=400, detail="Not authenticated")
+async def getRecommendedUltraTimeline(request: Request):
+  return await serveRecommendations("keyword", request)
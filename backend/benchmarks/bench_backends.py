@@ -0,0 +1,93 @@
+"""
+Accuracy-drift and throughput benchmark of the CLIP inference backends.
+Every backend embeds the same texts and images; drift is the cosine agreement with the
+fp32 torch embeddings, throughput is measured in items per second.
+
+Run from the backend directory:
+    python -m benchmarks.bench_backends --backends torch torch-int8 onnx --threads 4
+"""
+import argparse
+import json
+import time
+import numpy as np
+from PIL import Image
+from models.Embeddings import EmbeddingModel
+from models.InferenceBackend import cosine_agreement
+
+SAMPLE_TEXTS = [
+    "Sunset over the harbour tonight, the whole sky turned orange",
+    "New release of our open-source Python library is out, with faster parsing",
+    "Does anyone have recommendations for a good mechanical keyboard?",
+    "The city council voted to expand the bike lane network downtown",
+    "My cat discovered the printer and now refuses to leave it",
+    "Thread: what I learned running a small Mastodon instance for a year",
+    "Fresh sourdough out of the oven, crumb shot below",
+    "Climate report shows another record-breaking summer across Europe",
+]
+
+
+def sample_images(n, rng):
+    """
+    Synthetic photos-like images: smooth gradients with noise, at typical upload sizes.
+    """
+    images = []
+    for i in range(n):
+        width, height = [(1024, 768), (640, 640), (1600, 900)][i % 3]
+        gradient = np.linspace(0, 255, width, dtype=np.float32)[None, :, None] * rng.random(3, dtype=np.float32)
+        noise = rng.normal(0, 20, (height, width, 3)).astype(np.float32)
+        images.append(Image.fromarray(np.clip(gradient + noise, 0, 255).astype(np.uint8)))
+    return images
+
+
+def throughput(fn, items, repeat):
+    fn(items[:2])  # warm-up
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(items)
+        best = min(best, time.perf_counter() - start)
+    return len(items) / best
+
+
+def run(backends, n_texts=64, n_images=32, batch_size=32, repeat=3, seed=0, num_threads=0):
+    rng = np.random.default_rng(seed)
+    texts = [SAMPLE_TEXTS[i % len(SAMPLE_TEXTS)] + f" #{i}" for i in range(n_texts)]
+    images = sample_images(n_images, rng)
+
+    reference = EmbeddingModel(batch_size=batch_size, backend="torch", num_threads=num_threads)
+    reference_texts = reference.generate_text_embeddings(texts)
+    reference_images = reference.generate_image_embeddings(images)
+
+    results = []
+    for backend in backends:
+        model = reference if backend == "torch" else EmbeddingModel(
+            batch_size=batch_size, backend=backend, num_threads=num_threads
+        )
+        results.append({
+            "backend": backend,
+            "text_per_second": throughput(model.generate_text_embeddings, texts, repeat),
+            "images_per_second": throughput(model.generate_image_embeddings, images, repeat),
+            "text_agreement": cosine_agreement(reference_texts, model.generate_text_embeddings(texts)),
+            "image_agreement": cosine_agreement(reference_images, model.generate_image_embeddings(images)),
+        })
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", nargs="+", default=["torch", "torch-int8"])
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--threads", type=int, default=0, help="Intra-op threads per backend, 0 for the defaults")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    results = run(args.backends, batch_size=args.batch_size, num_threads=args.threads)
+    for row in results:
+        print(
+            f"{row['backend']:>10}: {row['text_per_second']:7.1f} texts/s, {row['images_per_second']:6.1f} images/s | "
+            f"text cos {row['text_agreement']['mean_cosine']:.4f} (min {row['text_agreement']['min_cosine']:.4f}), "
+            f"image cos {row['image_agreement']['mean_cosine']:.4f} (min {row['image_agreement']['min_cosine']:.4f})"
+        )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,87 @@
+"""
+Recall/latency benchmark of the candidate retrieval index against the exact path
+(dense cosine_similarity matrix followed by a full sort).
+
+Run from the backend directory:
+    python -m benchmarks.bench_index --sizes 1000 10000 100000
+"""
+import argparse
+import json
+import time
+import numpy as np
+from sklearn.metrics.pairwise import cosine_similarity
+from models.VectorIndex import ExactIndex, IVFIndex
+from utils.similarity import normalize
+
+
+def synthetic_embeddings(n, dim, n_topics, rng):
+    """
+    Clustered vectors resembling post embeddings: each post is a noisy copy of one of n_topics directions.
+    """
+    topics = rng.standard_normal((n_topics, dim)).astype(np.float32)
+    return topics[rng.integers(n_topics, size=n)] + 0.6 * rng.standard_normal((n, dim)).astype(np.float32)
+
+
+def exact_baseline(public, favorites, k):
+    scores = cosine_similarity(public, favorites).mean(axis=1)
+    return np.array(sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)[:k])
+
+
+def timed(fn, repeat):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+
+def run(sizes, dim=512, n_favorites=20, k=40, n_probe=8, repeat=3, seed=0):
+    rng = np.random.default_rng(seed)
+    results = []
+    for n in sizes:
+        data = synthetic_embeddings(n + n_favorites, dim, n_topics=max(8, n // 200), rng=rng)
+        public, favorites = data[:n], data[n:]
+        query = normalize(favorites).mean(axis=0)
+
+        truth, baseline_seconds = timed(lambda: exact_baseline(public, favorites, k), repeat)
+
+        exact = ExactIndex(dim, capacity=n)
+        _, exact_build = timed(lambda: exact.add(np.arange(n), public), 1)
+        (exact_ids, _), exact_seconds = timed(lambda: exact.search(query, k), repeat)
+
+        ivf = IVFIndex(dim, capacity=n, n_probe=n_probe, min_train_size=min(n, 1000))
+        _, ivf_build = timed(lambda: ivf.add(np.arange(n), public), 1)
+        (ivf_ids, _), ivf_seconds = timed(lambda: ivf.search(query, k), repeat)
+
+        results.append({
+            "size": n,
+            "baseline_query_ms": baseline_seconds * 1000,
+            "exact_index_build_ms": exact_build * 1000,
+            "exact_index_query_ms": exact_seconds * 1000,
+            "exact_index_recall": len(set(exact_ids) & set(truth)) / k,
+            "ivf_build_ms": ivf_build * 1000,
+            "ivf_query_ms": ivf_seconds * 1000,
+            "ivf_recall": len(set(ivf_ids) & set(truth)) / k,
+        })
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--n-probe", type=int, default=8)
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    results = run(args.sizes, n_probe=args.n_probe)
+    for row in results:
+        print(
+            f"n={row['size']:>7}  baseline {row['baseline_query_ms']:8.2f} ms | "
+            f"exact {row['exact_index_query_ms']:7.2f} ms (recall {row['exact_index_recall']:.2f}) | "
+            f"ivf {row['ivf_query_ms']:7.2f} ms (recall {row['ivf_recall']:.2f})"
+        )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,180 @@
+"""
+End-to-end benchmark of the recommendation hot path on synthetic data.
+
+For every timeline size, get_similar_posts, KeywordRecommender and the single-pass recommend
+(both kinds at once, as the endpoints are served) run against a stub
+Mastodon client and locally served images, once cold (empty stores) and once warm.
+Per-stage latency, throughput and peak RSS are reported and saved as JSON so runs can be compared.
+Each size runs in its own process so peak RSS is not inflated by previous sizes.
+
+Run from the backend directory:
+    python -m benchmarks.bench_recommender --sizes 100 1000 10000 --output bench.json
+    python -m benchmarks.bench_recommender --sizes 1000 --compare bench.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+from collections import defaultdict
+from benchmarks.fixtures import LocalImageServer, StubMastodon
+from utils.memory import current_rss_bytes, peak_rss_bytes
+
+
+class StageTimer:
+    """
+    Accumulates wall time per stage by wrapping methods of the objects under test.
+    """
+
+    def __init__(self):
+        self.seconds = defaultdict(float)
+        self._wrapped = []
+
+    def wrap(self, obj, method, stage):
+        original = getattr(obj, method)
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                self.seconds[stage] += time.perf_counter() - start
+
+        setattr(obj, method, timed)
+        self._wrapped.append((obj, method, original))
+
+    def unwrap(self):
+        for obj, method, original in reversed(self._wrapped):
+            setattr(obj, method, original)
+        self._wrapped = []
+
+    def measure(self, stage, fn, *args, **kwargs):
+        start = time.perf_counter()
+        result = fn(*args, **kwargs)
+        self.seconds[stage] += time.perf_counter() - start
+        return result
+
+
+def serialize(recommendations):
+    # What the recommendation endpoints do with a computed list of (already slim) statuses
+    from src.serialization import dumps
+    return dumps(recommendations)
+
+
+def run_once(kind, client, stores, limit):
+    import models.Recommender
+    from models.Recommender import Recommender
+    from models.TimelineFetcher import TimelineFetcher
+
+    recommender = Recommender(client, embeddingStore=stores[0], profileStore=stores[1])
+    timer = StageTimer()
+    # Every candidate source creates its own fetchers, so time them all through the class;
+    # pages of different sources are fetched concurrently, so this is cumulative API time
+    timer.wrap(TimelineFetcher, "_fetch_page", "fetch")
+    if kind == "similar":
+        timer.wrap(recommender, "_update_profile", "profile")
+        timer.wrap(recommender, "_filter_posts", "filter")
+        timer.wrap(recommender, "_embed_posts", "embed")
+        timer.wrap(models.Recommender, "score", "score")
+        compute = recommender.get_similar_posts
+    elif kind == "hybrid":
+        timer.wrap(recommender, "_update_profile", "profile")
+        timer.wrap(recommender, "_filter_posts", "filter")
+        timer.wrap(recommender, "_embed_posts", "embed")
+        timer.wrap(recommender.keywordExtractor, "extractPostKeywords", "extract")
+        timer.wrap(recommender.ranker, "features", "score")
+        timer.wrap(recommender.ranker, "rank", "score")
+        compute = recommender.recommend
+    else:
+        timer.wrap(recommender.keywordExtractor, "extractPostKeywords", "extract")
+        timer.wrap(models.Recommender, "keyword_scores", "score")
+        compute = recommender.KeywordRecommender
+
+    start = time.perf_counter()
+    recommendations = compute(limit=limit)
+    total = time.perf_counter() - start
+    timer.unwrap()
+    if isinstance(recommendations, dict):
+        recommendations = [post for posts in recommendations.values() for post in posts]
+    timer.measure("serialize", serialize, recommendations)
+    # Time not covered by a stage: candidate store and heap maintenance and waiting for fetched pages
+    timer.seconds["other"] = max(0.0, total - sum(
+        seconds for stage, seconds in timer.seconds.items() if stage not in ("fetch", "serialize")
+    ))
+    return {
+        "total_seconds": total,
+        "posts_per_second": limit / total,
+        "stages_ms": {stage: seconds * 1000 for stage, seconds in timer.seconds.items()},
+        "api_calls": client.calls,
+        "recommendations": len(recommendations),
+    }
+
+
+def run_size(size, latency, image_ratio, seed):
+    from models.EmbeddingStore import EmbeddingStore
+    from models.Registry import registry
+    from models.UserProfile import ProfileStore
+
+    registry.warm_up()
+    result = {"size": size, "rss_after_model_load_bytes": current_rss_bytes()}
+    with LocalImageServer() as images, tempfile.TemporaryDirectory() as data_dir:
+        client = StubMastodon.generate(
+            size, media_base_url=images.base_url, image_ratio=image_ratio, latency=latency, seed=seed
+        )
+        stores = (
+            EmbeddingStore(os.path.join(data_dir, "embeddings.sqlite3")),
+            ProfileStore(os.path.join(data_dir, "profiles.sqlite3")),
+        )
+        for kind in ("similar", "keyword", "hybrid"):
+            for phase in ("cold", "warm"):
+                client.calls = 0
+                result[f"{kind}_{phase}"] = run_once(kind, client, stores, size)
+    result["peak_rss_bytes"] = peak_rss_bytes()
+    return result
+
+
+def compare(results, baseline_path):
+    """
+    Print the change of every total and stage time relative to a previous run.
+    """
+    with open(baseline_path) as f:
+        baseline = {row["size"]: row for row in json.load(f)["results"]}
+    for row in results:
+        previous = baseline.get(row["size"])
+        if previous is None:
+            continue
+        for key, value in row.items():
+            if isinstance(value, dict) and key in previous:
+                ratio = value["total_seconds"] / previous[key]["total_seconds"]
+                print(f"n={row['size']:>6} {key:<15} {ratio:6.2f}x of baseline total time")
+        print(f"n={row['size']:>6} peak RSS {row['peak_rss_bytes'] / previous['peak_rss_bytes']:6.2f}x of baseline")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--latency", type=float, default=0.05, help="Simulated API latency per call in seconds")
+    parser.add_argument("--image-ratio", type=float, default=0.3, help="Fraction of posts with an image")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--compare", help="JSON results of a previous run to compare against")
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    results = []
+    for size in args.sizes:
+        with context.Pool(1) as pool:
+            row = pool.apply(run_size, (size, args.latency, args.image_ratio, args.seed))
+        results.append(row)
+        for kind in ("similar_cold", "similar_warm", "keyword_cold", "keyword_warm", "hybrid_cold", "hybrid_warm"):
+            stages = ", ".join(f"{stage} {ms:.0f}ms" for stage, ms in row[kind]["stages_ms"].items())
+            print(f"n={size:>6} {kind:<13} {row[kind]['total_seconds']:7.2f}s "
+                  f"({row[kind]['posts_per_second']:7.1f} posts/s) | {stages}")
+        print(f"n={size:>6} peak RSS {row['peak_rss_bytes'] / 2 ** 20:.0f} MiB")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"created_at": time.time(), "args": vars(args), "results": results}, f, indent=2)
+    if args.compare:
+        compare(results, args.compare)
@@ -0,0 +1,65 @@
+"""
+Benchmark of utils.similarity scoring against the previous per-pair implementation
+(one sklearn cosine_similarity call per public post and favourite, then a full sort).
+The per-pair baseline is only run up to --max-baseline-size candidates, it is far too slow beyond.
+
+Run from the backend directory:
+    python -m benchmarks.bench_similarity --sizes 1000 10000 100000
+"""
+import argparse
+import json
+import numpy as np
+from sklearn.metrics.pairwise import cosine_similarity
+from benchmarks.bench_index import synthetic_embeddings, timed
+from utils.similarity import AGGREGATIONS, normalize, rank
+
+
+def per_pair_baseline(public, favorites, k):
+    similarities = []
+    for i, public_embedding in enumerate(public):
+        max_similarity = max(
+            cosine_similarity([public_embedding], [fav_emb])[0][0]
+            for fav_emb in favorites
+        )
+        similarities.append((i, max_similarity))
+    return [i for i, _ in sorted(similarities, key=lambda x: x[1], reverse=True)[:k]]
+
+
+def run(sizes, dim=512, n_favorites=20, k=40, repeat=3, max_baseline_size=2000, seed=0):
+    rng = np.random.default_rng(seed)
+    results = []
+    for n in sizes:
+        data = synthetic_embeddings(n + n_favorites, dim, n_topics=max(8, n // 200), rng=rng)
+        public, favorites = normalize(data[:n]), normalize(data[n:])
+        row = {"size": n}
+        if n <= max_baseline_size:
+            truth, seconds = timed(lambda: per_pair_baseline(public, favorites, k), 1)
+            row["baseline_ms"] = seconds * 1000
+        for aggregation in AGGREGATIONS:
+            (ids, _), seconds = timed(lambda: rank(public, favorites, k, aggregation), repeat)
+            row[f"{aggregation}_ms"] = seconds * 1000
+            if aggregation == "max" and "baseline_ms" in row:
+                row["max_recall"] = len(set(ids.tolist()) & set(truth)) / k
+        results.append(row)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--max-baseline-size", type=int, default=2000)
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    results = run(args.sizes, max_baseline_size=args.max_baseline_size)
+    for row in results:
+        baseline = (
+            f"baseline {row['baseline_ms']:9.1f} ms ({row['baseline_ms'] / row['max_ms']:6.0f}x, "
+            f"recall {row['max_recall']:.2f}) | " if "baseline_ms" in row else ""
+        )
+        print(f"n={row['size']:>7}  {baseline}" + " | ".join(
+            f"{aggregation} {row[f'{aggregation}_ms']:7.2f} ms" for aggregation in AGGREGATIONS
+        ))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,226 @@
+"""
+Synthetic Mastodon data for benchmarks: a status generator, a stub Mastodon client that
+replays generated or recorded timelines, and a local HTTP server for the media attachments.
+"""
+import io
+import json
+import random
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+from PIL import Image
+
+TOPICS = {
+    "photography": ["sunset", "lens", "portrait", "landscape", "film", "exposure", "golden hour"],
+    "python": ["release", "library", "async", "typing", "packaging", "performance", "debugging"],
+    "cats": ["kitten", "nap", "purring", "whiskers", "litter", "treats", "windowsill"],
+    "climate": ["emissions", "heatwave", "solar", "policy", "record", "flooding", "renewables"],
+    "cooking": ["sourdough", "recipe", "spices", "oven", "noodles", "harvest", "breakfast"],
+    "cycling": ["bike lane", "commute", "gravel", "helmet", "tyres", "route", "city council"],
+}
+FILLER = ["today", "finally", "really", "honestly", "again", "this week", "everyone", "what do you think"]
+
+
+class StatusGenerator:
+    """
+    Generates Mastodon-like status dicts with the fields the recommender and frontend use.
+    A fraction of the posts are reblogs or near-duplicates, like a real local timeline.
+    """
+
+    def __init__(self, media_base_url: str = None, image_ratio: float = 0.3, duplicate_ratio: float = 0.05,
+                 seed: int = 0):
+        self.media_base_url = media_base_url
+        self.image_ratio = image_ratio
+        self.duplicate_ratio = duplicate_ratio
+        self.random = random.Random(seed)
+        self.start = datetime(2024, 12, 1, tzinfo=timezone.utc)
+
+    def status(self, status_id: int, topic: str = None) -> dict:
+        rand = self.random
+        topic = topic or rand.choice(list(TOPICS))
+        words = rand.sample(TOPICS[topic], 3) + rand.sample(FILLER, 2)
+        rand.shuffle(words)
+        author = rand.randrange(200)
+        media = []
+        if self.media_base_url and rand.random() < self.image_ratio:
+            image = rand.randrange(64)
+            media.append({
+                "id": status_id * 10,
+                "type": "image",
+                "url": f"{self.media_base_url}/media/{image}.jpg",
+                "preview_url": f"{self.media_base_url}/media/{image}.jpg?preview",
+                "description": f"A picture about {topic}",
+                "blurhash": None,
+            })
+        return {
+            "id": status_id,
+            "uri": f"https://bench.example/users/user{author}/statuses/{status_id}",
+            "url": f"https://bench.example/@user{author}/{status_id}",
+            "created_at": self.start + timedelta(seconds=status_id),
+            "language": "en",
+            "content": f"<p>{' '.join(words).capitalize()} <a href=\"https://bench.example/tags/{topic}\">#{topic}</a></p>",
+            "sensitive": False,
+            "reblog": None,
+            "reblogs_count": rand.randrange(20),
+            "favourites_count": rand.randrange(50),
+            "replies_count": rand.randrange(10),
+            "account": {
+                "id": author,
+                "username": f"user{author}",
+                "acct": f"user{author}",
+                "display_name": f"User {author}",
+                "avatar": f"https://bench.example/avatars/{author}.png",
+                "url": f"https://bench.example/@user{author}",
+            },
+            "media_attachments": media,
+            "tags": [{"name": topic}],
+        }
+
+    def timeline(self, n: int, first_id: int = 100000) -> list:
+        """
+        Generate n statuses, newest first.
+        """
+        posts = []
+        for status_id in range(first_id + n, first_id, -1):
+            if posts and self.random.random() < self.duplicate_ratio:
+                original = self.random.choice(posts)
+                uri = f"https://bench.example/statuses/{status_id}"
+                if self.random.random() < 0.5:
+                    # A boost: an empty wrapper status around the original
+                    post = dict(original, id=status_id, uri=uri, content="", language=None,
+                                media_attachments=[], tags=[], reblog=original)
+                else:
+                    # A lightly edited repost
+                    post = dict(original, id=status_id, uri=uri,
+                                content=original["content"].replace("</p>", f" {self.random.choice(FILLER)}</p>"))
+            else:
+                post = self.status(status_id)
+            posts.append(post)
+        return posts
+
+
+class StubMastodon:
+    """
+    Replays fixed timelines through the subset of the Mastodon.py client API the recommender uses,
+    including id-based pagination and an optional simulated network latency per call.
+    """
+
+    def __init__(self, timeline: list, favourites: list, latency: float = 0.0,
+                 api_base_url: str = "https://bench.example", access_token: str = "bench-token"):
+        self.posts = sorted(timeline, key=lambda post: post["id"], reverse=True)
+        self._favourites = favourites
+        self.latency = latency
+        self.api_base_url = api_base_url
+        self.access_token = access_token
+        self.ratelimit_remaining = 300
+        self.ratelimit_reset = time.time() + 300
+        self.calls = 0
+
+    @classmethod
+    def generate(cls, n_posts: int, n_favourites: int = 20, media_base_url: str = None, image_ratio: float = 0.3,
+                 seed: int = 0, **kwargs):
+        generator = StatusGenerator(media_base_url, image_ratio=image_ratio, seed=seed)
+        favourites = [generator.status(i, topic=("python" if i % 2 else "photography")) for i in range(n_favourites)]
+        return cls(generator.timeline(n_posts), favourites, **kwargs)
+
+    @classmethod
+    def from_file(cls, path: str, **kwargs):
+        """
+        Load a recorded fixture: JSON with "timeline" and "favourites" lists of statuses.
+        """
+        with open(path) as f:
+            data = json.load(f)
+        for post in data["timeline"] + data["favourites"]:
+            if isinstance(post.get("created_at"), str):
+                post["created_at"] = datetime.fromisoformat(post["created_at"].replace("Z", "+00:00"))
+        return cls(data["timeline"], data["favourites"], **kwargs)
+
+    def _call(self):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _page(self, posts, max_id=None, since_id=None, min_id=None, limit=20, **kwargs):
+        self._call()
+        if max_id is not None:
+            posts = [post for post in posts if post["id"] < int(max_id)]
+        if since_id is not None:
+            posts = [post for post in posts if post["id"] > int(since_id)]
+        if min_id is not None:
+            posts = [post for post in posts if post["id"] > int(min_id)][-(limit or 20):]
+        return posts[:min(limit or 20, 40)]
+
+    def timeline_local(self, **kwargs):
+        return self._page(self.posts, **kwargs)
+
+    def timeline_public(self, **kwargs):
+        return self._page(self.posts, **kwargs)
+
+    def timeline_hashtag(self, hashtag, **kwargs):
+        return self._page([post for post in self.posts if {"name": hashtag} in post["tags"]], **kwargs)
+
+    def trending_statuses(self, limit=20, **kwargs):
+        self._call()
+        return sorted(self.posts, key=lambda post: post["favourites_count"], reverse=True)[:limit]
+
+    def favourites(self, limit=20, **kwargs):
+        self._call()
+        return self._favourites[:limit]
+
+    def account_verify_credentials(self):
+        self._call()
+        return {"id": 1, "username": "bench", "display_name": "Benchmark"}
+
+
+def _jpeg(seed, size=(1200, 900)):
+    rng = np.random.default_rng(seed)
+    gradient = np.linspace(0, 255, size[0], dtype=np.float32)[None, :, None] * rng.random(3, dtype=np.float32)
+    pixels = np.clip(gradient + rng.normal(0, 25, (size[1], size[0], 3)), 0, 255).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, "JPEG", quality=85)
+    return buffer.getvalue()
+
+
+class _ImageHTTPServer(ThreadingHTTPServer):
+    # The default listen backlog of 5 drops connections under concurrent fetching
+    request_queue_size = 128
+    daemon_threads = True
+
+
+class LocalImageServer:
+    """
+    Serves generated JPEGs at /media/<n>.jpg from memory so image fetching can be
+    benchmarked without touching the network.
+    """
+
+    def __init__(self, n_images: int = 64):
+        images = {f"/media/{i}.jpg": _jpeg(i) for i in range(n_images)}
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = images.get(self.path.split("?")[0])
+                if body is None:
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "image/jpeg")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = _ImageHTTPServer(("127.0.0.1", 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self._server.server_port}"
+
+    def __enter__(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
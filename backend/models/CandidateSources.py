@@ -0,0 +1,185 @@
+import logging
+import os
+import queue
+import threading
+from collections import Counter
+from mastodon import Mastodon
+from utils.metrics import metrics
+from .TimelineFetcher import DEFAULT_PREFETCH_PAGES, TimelineFetcher
+
+# Share of the candidate budget per source; "tags" is split over the hashtags of the user's favourites
+DEFAULT_SOURCES = os.getenv("CANDIDATE_SOURCES", "local:0.5,public:0.2,trends:0.1,tags:0.2")
+DEFAULT_MAX_TAGS = int(os.getenv("CANDIDATE_MAX_TAGS", "3"))
+
+logger = logging.getLogger(__name__)
+
+
+def parse_sources(spec: str) -> list:
+    """
+    Parse "name:weight,name:weight" into a list of (name, weight); the first source is the primary one.
+    """
+    sources = []
+    for item in spec.split(","):
+        name, _, weight = item.strip().partition(":")
+        if name:
+            sources.append((name, float(weight or 1)))
+    return sources
+
+
+def status_uri(post):
+    """
+    Identify a status across sources and instances; a reblog is identified by its original.
+    """
+    post = post.get("reblog") or post
+    return post.get("uri") or str(post["id"])
+
+
+class CandidateSources:
+    """
+    Merges candidate posts from several timelines fetched concurrently: local, public (federated),
+    trending statuses and the hashtag timelines of the tags the user favourites most.
+    The limit is a budget shared by all sources, split by their weights into quotas. Posts are
+    deduplicated by status URI as pages arrive, and budget a source leaves unused (e.g. a quiet
+    hashtag) is fetched from the primary source afterwards.
+    A failing secondary source is skipped; a failing primary source raises.
+    """
+
+    def __init__(self, mastodon: Mastodon, sources=DEFAULT_SOURCES, max_tags: int = DEFAULT_MAX_TAGS,
+                 prefetch_pages: int = DEFAULT_PREFETCH_PAGES):
+        """
+        :param sources: "name:weight" list (string or parsed) of "local", "public", "trends" and "tags".
+        :param max_tags: Number of favourite hashtags whose timelines are fetched.
+        :param prefetch_pages: Pages buffered between the fetching threads and the consumer.
+        """
+        self.mastodon = mastodon
+        self.sources = parse_sources(sources) if isinstance(sources, str) else list(sources)
+        self.max_tags = max_tags
+        self.prefetch_pages = prefetch_pages
+        # Timeline each candidate of the last iteration came from
+        self.source_of = {}
+
+    def quotas(self, limit: int, tags=()) -> dict:
+        """
+        Split the budget over the timelines to fetch.
+        :param tags: Hashtags for the "tags" source, most relevant first.
+        :return: Dictionary of timeline -> number of posts, primary timeline first.
+        """
+        weights = {}
+        for name, weight in self.sources:
+            if name == "tags":
+                tags = list(tags)[:self.max_tags]
+                for tag in tags:
+                    weights[f"tag:{tag}"] = weights.get(f"tag:{tag}", 0) + weight / len(tags)
+            elif weight > 0:
+                weights[name] = weights.get(name, 0) + weight
+        if not weights:
+            return {}
+        total = sum(weights.values())
+        quotas = {timeline: int(limit * weight / total) for timeline, weight in weights.items()}
+        primary = next(iter(quotas))
+        quotas[primary] += limit - sum(quotas.values())
+        return {timeline: quota for timeline, quota in quotas.items() if quota > 0}
+
+    def fetch(self, limit: int, tags=()) -> list:
+        return [post for page in self.iter_pages(limit, tags) for post in page]
+
+    def iter_pages(self, limit: int, tags=()):
+        """
+        Yield pages of unique posts from all sources as they arrive, until limit posts were produced.
+        :param tags: Hashtags for the "tags" source, most relevant first.
+        """
+        quotas = self.quotas(limit, tags)
+        if not quotas:
+            return
+        primary = next(iter(quotas))
+        self.source_of = {}
+        pages = queue.Queue(maxsize=self.prefetch_pages * len(quotas))
+        stop = threading.Event()
+        for timeline, quota in quotas.items():
+            threading.Thread(
+                target=self._forward, args=(timeline, quota, pages, stop), name=f"candidates-{timeline}", daemon=True
+            ).start()
+
+        produced = 0
+        primary_posts = 0
+        try:
+            running = len(quotas)
+            while running:
+                timeline, page = pages.get()
+                if page is None:
+                    running -= 1
+                    continue
+                if isinstance(page, BaseException):
+                    if timeline == primary:
+                        raise page
+                    logger.warning("Skipping candidate source %s: %s", timeline, page)
+                    continue
+                if timeline == primary:
+                    primary_posts += len(page)
+                unique = self._unique(timeline, page)[:limit - produced]
+                if unique:
+                    produced += len(unique)
+                    yield unique
+                if produced >= limit:
+                    return
+
+            # Spend the budget other sources left unused or lost to duplicates on the primary source;
+            # the posts it already produced come from the timeline cache and are dropped as duplicates
+            while produced < limit:
+                fetcher = TimelineFetcher(self.mastodon, primary, prefetch_pages=self.prefetch_pages)
+                fetched = 0
+                for page in fetcher.iter_pages(primary_posts + limit - produced):
+                    fetched += len(page)
+                    unique = self._unique(primary, page)[:limit - produced]
+                    if unique:
+                        produced += len(unique)
+                        yield unique
+                    if produced >= limit:
+                        return
+                if fetched <= primary_posts:
+                    return  # The primary timeline has no older posts
+                primary_posts = fetched
+        finally:
+            stop.set()
+
+    def _forward(self, timeline, quota, pages, stop):
+        def put(item):
+            while not stop.is_set():
+                try:
+                    pages.put((timeline, item), timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        fetcher = TimelineFetcher(self.mastodon, timeline, prefetch_pages=self.prefetch_pages)
+        try:
+            for page in fetcher.iter_pages(quota):
+                if not put(page):
+                    return
+        except Exception as e:
+            put(e)
+        finally:
+            put(None)
+
+    def _unique(self, timeline, page):
+        unique = []
+        for post in page:
+            uri = status_uri(post)
+            if uri not in self.source_of:
+                self.source_of[uri] = timeline
+                unique.append(post)
+        source = "tags" if timeline.startswith("tag:") else timeline
+        metrics.inc("mastoradar_candidates_total", len(unique), source=source, result="unique")
+        metrics.inc("mastoradar_candidates_total", len(page) - len(unique), source=source, result="duplicate")
+        return unique
+
+
+def favourite_tags(favourites, n: int = DEFAULT_MAX_TAGS) -> list:
+    """
+    The n hashtags used most in the given favourites, most frequent first.
+    """
+    counts = Counter(
+        tag["name"].lower() for post in favourites for tag in (post.get("reblog") or post).get("tags") or []
+    )
+    return [tag for tag, _ in counts.most_common(n)]
@@ -0,0 +1,115 @@
+import numpy as np
+from utils.preprocessing import parse_mastodon_post
+from utils.statuses import slim_status
+from .HybridRanker import timestamp
+from .VectorIndex import ExactIndex
+
+
+class Candidate:
+    """
+    The fields of a candidate post that ranking reads besides its embedding and numeric columns.
+    """
+    __slots__ = ("row", "tags")
+
+    def __init__(self, row: int, tags: tuple):
+        self.row = row
+        self.tags = tags
+
+
+class CandidateStore:
+    """
+    Columnar store of the candidates of one recommendation pass. Candidates are addressed by
+    integer row: embeddings live in the preallocated float32 matrix of an exact index, the
+    creation time and engagement in parallel arrays and the remaining ranking fields in slim
+    Candidate records, so scoring and ranking work on views of whole columns.
+    Instead of the full statuses, only their slim form (what the recommendation endpoints
+    render, see utils.statuses) is kept to rebuild the final top-k results, along with the plain
+    text the prefilter cleaned for keyword extraction.
+    """
+
+    def __init__(self, dim: int, capacity: int = 1024):
+        """
+        :param dim: Dimension of the embeddings.
+        :param capacity: Expected number of candidates; the columns grow beyond it when needed.
+        """
+        self.dim = dim
+        self.capacity = max(capacity, 1)
+        self.index = ExactIndex(dim, self.capacity)
+        self.records = []
+        self._statuses = []
+        self._texts = []
+        self._created_at = np.empty(self.capacity, dtype=np.float64)
+        self._engagement = np.empty(self.capacity, dtype=np.float32)
+
+    def __len__(self):
+        return len(self.records)
+
+    @property
+    def embeddings(self) -> np.ndarray:
+        """
+        Normalised embedding matrix, one row per candidate, zero for candidates without an embedding;
+        a view, not a copy.
+        """
+        return self.index.vectors
+
+    @property
+    def created_at(self) -> np.ndarray:
+        """
+        Creation time of each candidate as a Unix timestamp, NaN when unknown.
+        """
+        return self._created_at[:len(self)]
+
+    @property
+    def engagement(self) -> np.ndarray:
+        """
+        Log of the favourite, reblog and reply counts of each candidate.
+        """
+        return self._engagement[:len(self)]
+
+    def add(self, posts, embeddings, texts) -> np.ndarray:
+        """
+        Append candidates.
+        :param posts: Statuses, reblogs already replaced by their original.
+        :param embeddings: One embedding (or None) per post.
+        :param texts: Plain text of each post, kept for keyword extraction.
+        :return: The rows the candidates were stored at.
+        """
+        if not len(posts):
+            return np.empty(0, dtype=np.int64)
+        start = len(self)
+        rows = self.index.add(
+            range(start, start + len(posts)),
+            [np.zeros(self.dim, dtype=np.float32) if embedding is None else embedding for embedding in embeddings],
+        )
+        end = start + len(posts)
+        if end > len(self._created_at):
+            capacity = max(end, 2 * len(self._created_at))
+            self._created_at = np.resize(self._created_at, capacity)
+            self._engagement = np.resize(self._engagement, capacity)
+
+        for row, post in zip(rows, posts):
+            created_at = timestamp(post.get("created_at"))
+            self._created_at[row] = np.nan if created_at is None else created_at
+            self._engagement[row] = np.log1p(
+                (post.get("favourites_count") or 0) + 2 * (post.get("reblogs_count") or 0)
+                + (post.get("replies_count") or 0)
+            )
+            self.records.append(Candidate(int(row), tuple(tag.lower() for tag in parse_mastodon_post(post)["tags"])))
+            self._statuses.append(slim_status(post))
+        self._texts.extend(texts)
+        return rows
+
+    def statuses(self, rows=None) -> list:
+        """
+        Rehydrate candidates into their slim statuses.
+        :param rows: Rows to read back in order, all of them by default.
+        """
+        if rows is None:
+            return list(self._statuses)
+        return [self._statuses[row] for row in rows]
+
+    def texts(self) -> list:
+        """
+        Plain text of every candidate, in row order.
+        """
+        return list(self._texts)
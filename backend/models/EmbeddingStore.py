@@ -0,0 +1,107 @@
+import os
+import sqlite3
+import threading
+import time
+import numpy as np
+
+DEFAULT_STORE_PATH = os.getenv(
+    "EMBEDDING_STORE_PATH", os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "embeddings.sqlite3")
+)
+DEFAULT_MAX_ENTRIES = int(os.getenv("EMBEDDING_STORE_MAX_ENTRIES", "200000"))
+# SQLite limits the number of bound parameters per statement
+_CHUNK = 500
+
+
+class EmbeddingStore:
+    """
+    Persistent embedding store backed by a SQLite sidecar file.
+    Vectors are keyed by model name and status URI, survive process restarts and
+    are evicted least-recently-used first once the store exceeds max_entries.
+    A post without any embeddable content is stored as an empty vector so it is not recomputed.
+    """
+
+    def __init__(self, path: str = DEFAULT_STORE_PATH, max_entries: int = DEFAULT_MAX_ENTRIES, dtype=np.float16):
+        self.path = path
+        self.max_entries = max_entries
+        self.dtype = np.dtype(dtype)
+        self._lock = threading.Lock()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " model TEXT NOT NULL, key TEXT NOT NULL, dtype TEXT NOT NULL, vector BLOB NOT NULL,"
+            " last_access REAL NOT NULL, PRIMARY KEY (model, key))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_access ON embeddings (last_access)")
+        self._conn.commit()
+        self._count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def __len__(self):
+        return self._count
+
+    def get_many(self, model: str, keys: list) -> dict:
+        """
+        Look up stored embeddings and mark them as recently used.
+        :param model: Name of the model that produced the embeddings.
+        :param keys: Status URIs to look up.
+        :return: Dictionary of key -> float32 vector (or None) for every key found.
+        """
+        found = {}
+        keys = list(dict.fromkeys(keys))
+        now = time.time()
+        with self._lock:
+            for start in range(0, len(keys), _CHUNK):
+                chunk = keys[start:start + _CHUNK]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, dtype, vector FROM embeddings WHERE model = ? AND key IN ({placeholders})",
+                    [model, *chunk],
+                ).fetchall()
+                for key, dtype, vector in rows:
+                    found[key] = np.frombuffer(vector, dtype=dtype).astype(np.float32) if vector else None
+                if rows:
+                    self._conn.execute(
+                        f"UPDATE embeddings SET last_access = ? WHERE model = ? AND key IN ({placeholders})",
+                        [now, model, *chunk],
+                    )
+            self._conn.commit()
+        return found
+
+    def put_many(self, model: str, embeddings: dict):
+        """
+        Store embeddings, evicting the least recently used entries if the store grows too large.
+        :param model: Name of the model that produced the embeddings.
+        :param embeddings: Dictionary of key -> vector (or None).
+        """
+        if not embeddings:
+            return
+        now = time.time()
+        rows = [
+            (model, key, self.dtype.str,
+             b"" if vector is None else np.asarray(vector, dtype=self.dtype).tobytes(), now)
+            for key, vector in embeddings.items()
+        ]
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?, ?)", rows)
+            self._count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            if self._count > self.max_entries:
+                self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """
+        Drop the least recently used entries, leaving 10% headroom so eviction is amortised.
+        """
+        target = int(self.max_entries * 0.9)
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE rowid IN (SELECT rowid FROM embeddings ORDER BY last_access LIMIT ?)",
+            (self._count - target,),
+        )
+        self._count = target
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
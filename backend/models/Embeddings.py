@@ -1,15 +1,38 @@
 from transformers import CLIPProcessor, CLIPModel
 from PIL import Image
-import requests
+from .ImageFetcher import image_fetcher
+from .InferenceBackend import DEFAULT_BACKEND, DEFAULT_NUM_THREADS, TorchBackend, create_backend
+from utils.metrics import metrics
+import numpy as np
+import io
+import os
 import torch
 
+CLIP_MODEL_NAME = "openai/clip-vit-base-patch32"
+DEFAULT_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+# Input resolution and pixel statistics CLIP was trained with (what CLIPProcessor applies)
+CLIP_IMAGE_SIZE = 224
+CLIP_MEAN = np.array([0.48145466, 0.4578275, 0.40821073], dtype=np.float32)[:, None, None]
+CLIP_STD = np.array([0.26862954, 0.26130258, 0.27577711], dtype=np.float32)[:, None, None]
+
 
 class EmbeddingModel:
     """Generates embeddings using OpenAI's CLIP model."""
 
-    def __init__(self):
-        self.clip_model = CLIPModel.from_pretrained("openai/clip-vit-base-patch32")
-        self.clip_processor = CLIPProcessor.from_pretrained("openai/clip-vit-base-patch32")
+    def __init__(self, batch_size: int = DEFAULT_BATCH_SIZE, backend: str = DEFAULT_BACKEND,
+                 num_threads: int = DEFAULT_NUM_THREADS):
+        """
+        :param backend: Inference backend running the model, see InferenceBackend.create_backend.
+        :param num_threads: Intra-op threads of the backend, 0 for its default.
+        """
+        clip_model = CLIPModel.from_pretrained(CLIP_MODEL_NAME).eval()
+        self.clip_processor = CLIPProcessor.from_pretrained(CLIP_MODEL_NAME)
+        self.dim = clip_model.config.projection_dim
+        # Only the backend keeps the model, so the fp32 weights are freed when it converts them
+        self.backend = create_backend(backend, clip_model, CLIP_MODEL_NAME, num_threads)
+        # Embeddings from other backends drift slightly, so they are stored under their own name
+        self.model_name = CLIP_MODEL_NAME if backend == TorchBackend.name else f"{CLIP_MODEL_NAME}:{backend}"
+        self.batch_size = batch_size
 
     def generate_text_embedding(self, text: str):
         """
@@ -17,9 +40,61 @@ class EmbeddingModel:
         :param text: The text to embed.
         :return: A numpy array of the embedding.
         """
-        inputs = self.clip_processor(text=[text], return_tensors="pt", padding=True, truncation=True)
-        with torch.no_grad():
-            return self.clip_model.get_text_features(**inputs).squeeze(0).numpy()
+        return self.generate_text_embeddings([text])[0]
+
+    def generate_text_embeddings(self, texts: list, batch_size: int = None):
+        """
+        Generate CLIP embeddings for many texts, one padded forward pass per batch.
+        :param texts: The texts to embed.
+        :param batch_size: Number of texts per forward pass (defaults to the model's batch size).
+        :return: A numpy array of shape (len(texts), dim).
+        """
+        batch_size = batch_size or self.batch_size
+        batches = []
+        for start in range(0, len(texts), batch_size):
+            inputs = self.clip_processor(
+                text=texts[start:start + batch_size], return_tensors="pt", padding=True, truncation=True
+            )
+            with metrics.span("text_forward", "clip"):
+                batches.append(self.backend.text_features(inputs))
+        metrics.inc("mastoradar_embedded_items_total", len(texts), kind="text")
+        return np.concatenate(batches) if batches else np.empty((0, self.dim), dtype=np.float32)
+
+    def load_image(self, image_url: str) -> Image.Image:
+        """
+        Download an image and decode it as RGB.
+        :param image_url: URL of the image.
+        :return: A PIL image.
+        """
+        return self.decode_image(image_fetcher.fetch(image_url))
+
+    @metrics.timed("decode_image", "clip")
+    def decode_image(self, data: bytes) -> Image.Image:
+        """
+        Decode downloaded image bytes as RGB, no larger than needed for CLIP: JPEGs are decoded
+        directly at a reduced scale (DCT scaling) that still covers CLIP_IMAGE_SIZE.
+        :param data: Raw image bytes.
+        :return: A PIL image.
+        """
+        image = Image.open(io.BytesIO(data))
+        image.draft("RGB", (CLIP_IMAGE_SIZE, CLIP_IMAGE_SIZE))
+        return image.convert("RGB")
+
+    @staticmethod
+    def preprocess_image(image: Image.Image) -> np.ndarray:
+        """
+        CLIP preprocessing: resize the shortest side to CLIP_IMAGE_SIZE (bicubic), center crop,
+        scale to [0, 1] and normalise with the CLIP pixel statistics.
+        :param image: RGB PIL image.
+        :return: float32 array of shape (3, CLIP_IMAGE_SIZE, CLIP_IMAGE_SIZE).
+        """
+        scale = CLIP_IMAGE_SIZE / min(image.size)
+        width, height = (max(CLIP_IMAGE_SIZE, int(side * scale)) for side in image.size)
+        image = image.resize((width, height), Image.BICUBIC, reducing_gap=3.0)
+        left, top = (width - CLIP_IMAGE_SIZE) // 2, (height - CLIP_IMAGE_SIZE) // 2
+        image = image.crop((left, top, left + CLIP_IMAGE_SIZE, top + CLIP_IMAGE_SIZE))
+        pixels = np.asarray(image, dtype=np.float32).transpose(2, 0, 1) / 255.0
+        return (pixels - CLIP_MEAN) / CLIP_STD
 
     def generate_image_embedding(self, image_url: str):
         """
@@ -27,10 +102,23 @@ class EmbeddingModel:
         :param image_url: URL of the image.
         :return: A numpy array of the embedding.
         """
-        response = requests.get(image_url, stream=True)
-        response.raise_for_status()
-        image = Image.open(response.raw).convert("RGB")
-        inputs = self.clip_processor(images=image, return_tensors="pt")
-        with torch.no_grad():
-            return self.clip_model.get_image_features(**inputs).squeeze(0).numpy()
-            
\ No newline at end of file
+        return self.generate_image_embeddings([self.load_image(image_url)])[0]
+
+    def generate_image_embeddings(self, images: list, batch_size: int = None):
+        """
+        Generate CLIP embeddings for many images, one forward pass per batch.
+        :param images: PIL images or arrays already run through preprocess_image.
+        :param batch_size: Number of images per forward pass (defaults to the model's batch size).
+        :return: A numpy array of shape (len(images), dim).
+        """
+        batch_size = batch_size or self.batch_size
+        batches = []
+        for start in range(0, len(images), batch_size):
+            pixel_values = np.stack([
+                self.preprocess_image(image) if isinstance(image, Image.Image) else image
+                for image in images[start:start + batch_size]
+            ])
+            with metrics.span("image_forward", "clip"):
+                batches.append(self.backend.image_features(torch.from_numpy(pixel_values)))
+        metrics.inc("mastoradar_embedded_items_total", len(images), kind="image")
+        return np.concatenate(batches) if batches else np.empty((0, self.dim), dtype=np.float32)
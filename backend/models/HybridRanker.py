@@ -0,0 +1,169 @@
+import math
+import os
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+import numpy as np
+from utils.similarity import score, top_k
+
+FEATURES = ("embedding", "keywords", "recency", "engagement", "hashtags")
+DEFAULT_RECENCY_HALF_LIFE = float(os.getenv("RANKING_RECENCY_HALF_LIFE_HOURS", "24"))
+
+
+def parse_weights(spec: str) -> dict:
+    """
+    Parse "feature:weight,feature:weight" into a dictionary of feature weights.
+    """
+    weights = {}
+    for item in spec.split(","):
+        name, _, weight = item.strip().partition(":")
+        if name:
+            if name not in FEATURES:
+                raise ValueError(f"Unknown ranking feature '{name}', expected one of {', '.join(FEATURES)}")
+            weights[name] = float(weight or 1)
+    return weights
+
+
+# Weight presets, one per recommendation endpoint
+DEFAULT_PRESETS = {
+    "similar": parse_weights(os.getenv(
+        "RANKING_WEIGHTS_SIMILAR", "embedding:1,hashtags:0.1,recency:0.05,engagement:0.05"
+    )),
+    "keyword": parse_weights(os.getenv(
+        "RANKING_WEIGHTS_KEYWORD", "keywords:1,hashtags:0.1,recency:0.05,engagement:0.05"
+    )),
+}
+
+
+# Feature a candidate must have a non-zero value for to be ranked by a preset, e.g. posts sharing
+# no keyword with the favourites are no keyword recommendations, however recent or popular
+DEFAULT_REQUIRED = {"similar": "embedding", "keyword": "keywords"}
+
+
+def keyword_scores(post_keywords: list, liked_keywords: Counter) -> np.ndarray:
+    """
+    Weighted keyword overlap: each shared keyword counts as often as it occurs in the favourites,
+    scaled down for keywords that are common across the candidates.
+    :param post_keywords: One set of keywords per candidate.
+    :param liked_keywords: Keyword counts over the favourites.
+    """
+    # Inverted index keyword -> positions of the posts containing it
+    keyword_index = defaultdict(list)
+    for position, keywords in enumerate(post_keywords):
+        for keyword in keywords:
+            keyword_index[keyword].append(position)
+
+    scores = np.zeros(len(post_keywords), dtype=np.float32)
+    for keyword, count in liked_keywords.items():
+        matches = keyword_index.get(keyword)
+        if matches:
+            scores[matches] += count * math.log(1 + len(post_keywords) / len(matches))
+    return scores
+
+
+def timestamp(value):
+    """
+    Unix timestamp of a status date (datetime or ISO string), None if it cannot be read.
+    """
+    if isinstance(value, datetime):
+        return value.timestamp()
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+        except ValueError:
+            return None
+    return None
+
+
+def _min_max(values: np.ndarray) -> np.ndarray:
+    low, high = values.min(), values.max()
+    if high <= low:
+        return np.zeros_like(values)
+    return (values - low) / (high - low)
+
+
+class HybridRanker:
+    """
+    Ranks candidates by a weighted sum of cheap per-post features, each scaled to [0, 1] over
+    the candidate set:
+    - embedding: CLIP similarity to the user's profile,
+    - keywords: weighted TextRank keyword overlap with the favourites,
+    - recency: exponential decay with the post's age,
+    - engagement: log of the favourite, reblog and reply counts,
+    - hashtags: how often the post's hashtags occur in the favourites.
+    Features are computed once and every weight preset ranks the same candidates, restricted to
+    those with a non-zero value of the preset's required feature.
+    """
+
+    def __init__(self, presets: dict = None, recency_half_life_hours: float = DEFAULT_RECENCY_HALF_LIFE,
+                 required: dict = None):
+        """
+        :param presets: Dictionary of preset name -> feature weights.
+        :param recency_half_life_hours: Age at which the recency feature has halved.
+        :param required: Dictionary of preset name -> feature candidates need a non-zero value for.
+        """
+        self.presets = presets if presets is not None else DEFAULT_PRESETS
+        self.required = required if required is not None else DEFAULT_REQUIRED
+        self.recency_half_life = recency_half_life_hours * 3600
+
+    def features(self, candidates, queries=None, aggregation: str = "max", post_keywords: list = None,
+                 liked_keywords: Counter = None, liked_tags: Counter = None, now: float = None) -> dict:
+        """
+        Compute the raw features of the candidates; signals whose inputs are missing are left out.
+        :param candidates: CandidateStore holding the candidates' embeddings and ranking fields.
+        :param queries: Profile vectors the embeddings are scored against.
+        :param post_keywords: One set of keywords per candidate.
+        :param liked_keywords: Keyword counts over the favourites.
+        :param liked_tags: Hashtag counts over the favourites.
+        :return: Dictionary of feature -> float32 array with one value per candidate.
+        """
+        now = time.time() if now is None else now
+        features = {}
+        if queries is not None and len(candidates):
+            features["embedding"] = score(candidates.embeddings, queries, aggregation)
+        if post_keywords is not None and liked_keywords:
+            features["keywords"] = keyword_scores(post_keywords, liked_keywords)
+
+        age = np.maximum(0.0, now - candidates.created_at)
+        features["recency"] = np.nan_to_num(0.5 ** (age / self.recency_half_life), nan=0.0).astype(np.float32)
+        features["engagement"] = candidates.engagement
+        if liked_tags:
+            features["hashtags"] = np.fromiter(
+                (sum(liked_tags.get(tag, 0) for tag in record.tags) for record in candidates.records),
+                dtype=np.float32, count=len(candidates),
+            )
+        return features
+
+    def scores(self, features: dict, preset: str) -> np.ndarray:
+        """
+        Combine the features with the weights of a preset.
+        """
+        n = len(next(iter(features.values()))) if features else 0
+        total = np.zeros(n, dtype=np.float32)
+        for name, weight in self.presets[preset].items():
+            if weight and name in features:
+                total += weight * _min_max(features[name])
+        return total
+
+    def eligible(self, features: dict, preset: str) -> np.ndarray:
+        """
+        :return: Positions of the candidates a preset ranks: those with a non-zero required feature.
+        """
+        n = len(next(iter(features.values()))) if features else 0
+        required = self.required.get(preset)
+        if required is None:
+            return np.arange(n)
+        if required not in features:
+            return np.empty(0, dtype=np.int64)
+        return np.flatnonzero(features[required])
+
+    def rank(self, features: dict, preset: str, top_n: int) -> np.ndarray:
+        """
+        Features are scaled over the eligible candidates only, so ineligible ones don't skew the weights.
+        :return: Positions of the top_n candidates under a preset, best first.
+        """
+        rows = self.eligible(features, preset)
+        if not len(rows):
+            return rows
+        scores = self.scores({name: values[rows] for name, values in features.items()}, preset)
+        return rows[top_k(scores, top_n)]
@@ -0,0 +1,107 @@
+import asyncio
+import hashlib
+import os
+import threading
+import httpx
+import logging
+from utils.metrics import metrics
+
+DEFAULT_MAX_CONCURRENCY = int(os.getenv("IMAGE_FETCH_CONCURRENCY", "16"))
+DEFAULT_TIMEOUT = float(os.getenv("IMAGE_FETCH_TIMEOUT", "10"))
+DEFAULT_MAX_BYTES = int(os.getenv("IMAGE_FETCH_MAX_BYTES", str(10 * 1024 * 1024)))
+
+logger = logging.getLogger(__name__)
+
+
+class ImageFetcher:
+    """
+    Downloads images concurrently over one pooled async HTTP client.
+    The client lives on a dedicated event-loop thread so its connection pool is reused
+    across requests, while callers stay synchronous.
+    """
+
+    def __init__(self, max_concurrency: int = DEFAULT_MAX_CONCURRENCY, timeout: float = DEFAULT_TIMEOUT,
+                 max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._loop = None
+        self._client = None
+        self._semaphore = None
+
+    def _ensure_started(self):
+        if self._loop is None:
+            with self._lock:
+                if self._loop is None:
+                    loop = asyncio.new_event_loop()
+                    threading.Thread(target=loop.run_forever, name="image-fetcher", daemon=True).start()
+                    asyncio.run_coroutine_threadsafe(self._start_client(), loop).result()
+                    self._loop = loop
+
+    async def _start_client(self):
+        self._client = httpx.AsyncClient(
+            timeout=self.timeout,
+            follow_redirects=True,
+            limits=httpx.Limits(max_connections=self.max_concurrency, max_keepalive_connections=self.max_concurrency),
+        )
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+    @metrics.timed("fetch_images", "images")
+    def fetch_many(self, urls: list) -> dict:
+        """
+        Download many images concurrently.
+        :param urls: Image URLs to download.
+        :return: Dictionary of url -> (sha256 hex digest, bytes), or url -> None if the download failed.
+        """
+        urls = list(dict.fromkeys(urls))
+        if not urls:
+            return {}
+        self._ensure_started()
+        return asyncio.run_coroutine_threadsafe(self._fetch_all(urls), self._loop).result()
+
+    def fetch(self, url: str):
+        """
+        Download a single image.
+        :return: The image bytes.
+        """
+        result = self.fetch_many([url])[url]
+        if result is None:
+            raise IOError(f"Could not download image {url}")
+        return result[1]
+
+    async def _fetch_all(self, urls):
+        results = await asyncio.gather(*(self._fetch(url) for url in urls))
+        return dict(zip(urls, results))
+
+    async def _fetch(self, url):
+        async with self._semaphore:
+            try:
+                async with self._client.stream("GET", url) as response:
+                    response.raise_for_status()
+                    if int(response.headers.get("content-length") or 0) > self.max_bytes:
+                        return self._too_large(url)
+                    data = bytearray()
+                    async for chunk in response.aiter_bytes():
+                        data.extend(chunk)
+                        if len(data) > self.max_bytes:
+                            return self._too_large(url)
+            except Exception as e:
+                # Any failure (invalid URL, network, decoding of the response) only skips this image
+                logger.info("Skipping image %r: %s", url, e)
+                metrics.inc("mastoradar_image_fetch_total", result="error")
+                return None
+        data = bytes(data)
+        metrics.inc("mastoradar_image_fetch_total", result="ok")
+        metrics.inc("mastoradar_image_fetch_bytes_total", len(data))
+        return hashlib.sha256(data).hexdigest(), data
+
+
+    def _too_large(self, url):
+        logger.info("Skipping image %s: larger than %d bytes", url, self.max_bytes)
+        metrics.inc("mastoradar_image_fetch_total", result="too_large")
+        return None
+
+
+# Shared by every request so the connection pool is reused
+image_fetcher = ImageFetcher()
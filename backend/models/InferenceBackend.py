@@ -0,0 +1,167 @@
+import os
+import numpy as np
+import torch
+
+DEFAULT_BACKEND = os.getenv("CLIP_BACKEND", "torch")
+DEFAULT_NUM_THREADS = int(os.getenv("CLIP_NUM_THREADS", "0"))  # 0 keeps the torch default, see default_onnx_threads
+DEFAULT_ONNX_DIR = os.getenv(
+    "ONNX_CACHE_DIR", os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "onnx")
+)
+
+
+def default_onnx_threads() -> int:
+    """
+    Split the cores between the recommendation computations that may run inference at once,
+    instead of every ONNX Runtime session claiming all of them.
+    """
+    return max(1, (os.cpu_count() or 1) // max(1, int(os.getenv("INFERENCE_WORKERS", "2"))))
+
+
+class TorchBackend:
+    """Runs the CLIP towers in full-precision PyTorch."""
+
+    name = "torch"
+
+    def __init__(self, clip_model, num_threads: int = DEFAULT_NUM_THREADS):
+        if num_threads:
+            torch.set_num_threads(num_threads)
+        self.clip_model = clip_model.eval()
+
+    def text_features(self, inputs) -> np.ndarray:
+        """
+        :param inputs: Tokenizer output (input_ids, attention_mask) as torch tensors.
+        :return: Text embeddings of shape (batch, dim).
+        """
+        with torch.no_grad():
+            return self.clip_model.get_text_features(
+                input_ids=inputs["input_ids"], attention_mask=inputs["attention_mask"]
+            ).numpy()
+
+    def image_features(self, pixel_values) -> np.ndarray:
+        """
+        :param pixel_values: Preprocessed images as a torch tensor of shape (batch, 3, 224, 224).
+        :return: Image embeddings of shape (batch, dim).
+        """
+        with torch.no_grad():
+            return self.clip_model.get_image_features(pixel_values=pixel_values).numpy()
+
+
+class QuantizedTorchBackend(TorchBackend):
+    """
+    Dynamic int8 quantization of every Linear layer: weights are stored as int8 and
+    activations quantized on the fly, which speeds up the transformer blocks on CPU.
+    """
+
+    name = "torch-int8"
+
+    def __init__(self, clip_model, num_threads: int = DEFAULT_NUM_THREADS):
+        # In place, so the fp32 Linear weights are not kept next to the int8 ones
+        quantized = torch.quantization.quantize_dynamic(
+            clip_model.eval(), {torch.nn.Linear}, dtype=torch.qint8, inplace=True
+        )
+        super().__init__(quantized, num_threads)
+
+
+class _TextTower(torch.nn.Module):
+    def __init__(self, clip_model):
+        super().__init__()
+        self.clip_model = clip_model
+
+    def forward(self, input_ids, attention_mask):
+        return self.clip_model.get_text_features(input_ids=input_ids, attention_mask=attention_mask)
+
+
+class _VisionTower(torch.nn.Module):
+    def __init__(self, clip_model):
+        super().__init__()
+        self.clip_model = clip_model
+
+    def forward(self, pixel_values):
+        return self.clip_model.get_image_features(pixel_values=pixel_values)
+
+
+class OnnxBackend:
+    """
+    Runs the CLIP towers with ONNX Runtime. Both towers are exported once to cache_dir,
+    sessions use a fixed number of intra-op threads so several workers don't oversubscribe the CPU.
+    Requires the optional onnxruntime package.
+    """
+
+    name = "onnx"
+
+    def __init__(self, clip_model, model_name: str, num_threads: int = DEFAULT_NUM_THREADS,
+                 cache_dir: str = DEFAULT_ONNX_DIR):
+        try:
+            import onnxruntime
+        except ImportError as e:
+            raise ImportError("The onnx CLIP backend requires onnxruntime (pip install onnxruntime)") from e
+
+        export_dir = os.path.join(cache_dir, model_name.replace("/", "__"))
+        text_path = os.path.join(export_dir, "text.onnx")
+        vision_path = os.path.join(export_dir, "vision.onnx")
+        if not (os.path.exists(text_path) and os.path.exists(vision_path)):
+            os.makedirs(export_dir, exist_ok=True)
+            self._export(clip_model.eval(), text_path, vision_path)
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = num_threads or default_onnx_threads()
+        options.inter_op_num_threads = 1
+        providers = ["CPUExecutionProvider"]
+        self._text_session = onnxruntime.InferenceSession(text_path, options, providers=providers)
+        self._vision_session = onnxruntime.InferenceSession(vision_path, options, providers=providers)
+
+    def _export(self, clip_model, text_path, vision_path):
+        input_ids = torch.ones((2, 8), dtype=torch.long)
+        attention_mask = torch.ones((2, 8), dtype=torch.long)
+        torch.onnx.export(
+            _TextTower(clip_model), (input_ids, attention_mask), text_path,
+            input_names=["input_ids", "attention_mask"], output_names=["text_embeds"],
+            dynamic_axes={"input_ids": {0: "batch", 1: "sequence"}, "attention_mask": {0: "batch", 1: "sequence"},
+                          "text_embeds": {0: "batch"}},
+            opset_version=17,
+        )
+        torch.onnx.export(
+            _VisionTower(clip_model), (torch.zeros((2, 3, 224, 224)),), vision_path,
+            input_names=["pixel_values"], output_names=["image_embeds"],
+            dynamic_axes={"pixel_values": {0: "batch"}, "image_embeds": {0: "batch"}},
+            opset_version=17,
+        )
+
+    def text_features(self, inputs) -> np.ndarray:
+        return self._text_session.run(None, {
+            "input_ids": inputs["input_ids"].numpy().astype(np.int64),
+            "attention_mask": inputs["attention_mask"].numpy().astype(np.int64),
+        })[0]
+
+    def image_features(self, pixel_values) -> np.ndarray:
+        return self._vision_session.run(None, {"pixel_values": pixel_values.numpy().astype(np.float32)})[0]
+
+
+def create_backend(name: str, clip_model, model_name: str, num_threads: int = DEFAULT_NUM_THREADS):
+    """
+    Create the inference backend for a loaded CLIP model.
+    :param name: "torch" (fp32), "torch-int8" (dynamic quantization) or "onnx" (ONNX Runtime).
+    """
+    if name == TorchBackend.name:
+        return TorchBackend(clip_model, num_threads)
+    if name == QuantizedTorchBackend.name:
+        return QuantizedTorchBackend(clip_model, num_threads)
+    if name == OnnxBackend.name:
+        return OnnxBackend(clip_model, model_name, num_threads)
+    raise ValueError(f"Unknown CLIP backend {name}, expected torch, torch-int8 or onnx")
+
+
+def cosine_agreement(reference, candidate) -> dict:
+    """
+    Measure how closely a backend reproduces the reference embeddings.
+    :param reference: Embeddings from the fp32 torch backend, shape (n, dim).
+    :param candidate: Embeddings of the same inputs from another backend.
+    :return: Dictionary with the mean and minimum per-item cosine similarity.
+    """
+    reference = np.asarray(reference, dtype=np.float32)
+    candidate = np.asarray(candidate, dtype=np.float32)
+    cosines = (reference * candidate).sum(axis=1) / (
+        np.linalg.norm(reference, axis=1) * np.linalg.norm(candidate, axis=1)
+    )
+    return {"mean_cosine": float(cosines.mean()), "min_cosine": float(cosines.min())}
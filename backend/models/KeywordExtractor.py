@@ -1,24 +1,41 @@
 import spacy
 import pytextrank
-import re
+import os
+import threading
+from collections import OrderedDict
+from utils.preprocessing import clean_html
+
+DEFAULT_BATCH_SIZE = int(os.getenv("KEYWORD_BATCH_SIZE", "64"))
+DEFAULT_N_PROCESS = int(os.getenv("KEYWORD_N_PROCESS", "1"))
+DEFAULT_CACHE_SIZE = int(os.getenv("KEYWORD_CACHE_SIZE", "50000"))
+# pytextrank draws phrase candidates from noun chunks and named entities (doc.ents), so disabling
+# "ner" is faster but changes which keywords are extracted
+DEFAULT_DISABLE = tuple(name for name in os.getenv("KEYWORD_DISABLE_PIPES", "").split(",") if name)
+
 
 class KeywordExtractor:
-    def __init__(self):
+    def __init__(self, disable=DEFAULT_DISABLE, batch_size=DEFAULT_BATCH_SIZE, n_process=DEFAULT_N_PROCESS,
+                 cache_size=DEFAULT_CACHE_SIZE):
         """
         Initializes the KeywordExtractor by loading spaCy with the pytextrank pipeline.
         This setup allows for keyword extraction using the TextRank algorithm.
+        Pipeline components listed in disable are not run, keywords of already seen posts
+        are kept in a bounded LRU cache.
         """
-        self.nlp = spacy.load("en_core_web_sm")
+        self.nlp = spacy.load("en_core_web_sm", disable=list(disable))
         self.nlp.add_pipe("textrank")
+        self.batch_size = batch_size
+        self.n_process = n_process
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
 
     def clean_text(self, content: str) -> str:
         """
         Cleans the input text by removing HTML tags and URLs, ensuring that only relevant
         content is processed for keyword extraction.
         """
-        clean_content = re.sub(r'<.*?>', '', content)  # Remove HTML tags
-        clean_content = re.sub(r'http\S+', '', clean_content)  # Remove URLs
-        return clean_content
+        return clean_html(content)
 
     def extractKeywords(self, content: str, k=5) -> list:
         """
@@ -27,9 +44,45 @@ class KeywordExtractor:
         """
         cleaned_content = self.clean_text(content)
         doc = self.nlp(cleaned_content)
-        keywords = [p.text for p in doc._.phrases[:k] if self.is_relevant_keyword(p.text)]
+        return self._keywordsFromDoc(doc, k)
+
+    def extractKeywordsBatch(self, contents: list, k=5) -> list:
+        """
+        Extracts keywords from many texts at once, streaming them through nlp.pipe in batches
+        (and n_process worker processes if configured).
+        :return: One list of keywords per content, in order.
+        """
+        return self._keywordsFromTexts((self.clean_text(content) for content in contents), k)
+
+    def extractPostKeywords(self, posts: dict, k=5) -> dict:
+        """
+        Extracts keywords for posts, running the pipeline only for posts not seen before.
+        :param posts: Dictionary of status key (URI) -> plain text, already cleaned (see clean_text).
+        :return: Dictionary of status key -> list of keywords.
+        """
+        keywords = {}
+        with self._cache_lock:
+            for key in posts:
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    keywords[key] = self._cache[key]
+        missing = [key for key in posts if key not in keywords]
+        if missing:
+            extracted = dict(zip(missing, self._keywordsFromTexts([posts[key] for key in missing], k)))
+            keywords.update(extracted)
+            with self._cache_lock:
+                self._cache.update(extracted)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
         return keywords
 
+    def _keywordsFromTexts(self, texts, k) -> list:
+        docs = self.nlp.pipe(texts, batch_size=self.batch_size, n_process=self.n_process)
+        return [self._keywordsFromDoc(doc, k) for doc in docs]
+
+    def _keywordsFromDoc(self, doc, k) -> list:
+        return [p.text for p in doc._.phrases[:k] if self.is_relevant_keyword(p.text)]
+
     def is_relevant_keyword(self, keyword: str) -> bool:
         """
         Determines whether a keyword is relevant by filtering out stop words
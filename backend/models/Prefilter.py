@@ -0,0 +1,120 @@
+import os
+import numpy as np
+from collections import Counter, defaultdict
+from utils.metrics import metrics
+from utils.preprocessing import MINHASH_PERMUTATIONS, ascii_letter_ratio, clean_html, minhash, parse_mastodon_post
+
+DEFAULT_MAX_PER_AUTHOR = int(os.getenv("PREFILTER_MAX_PER_AUTHOR", "10"))
+DEFAULT_NEAR_DUPLICATE_SIMILARITY = float(os.getenv("PREFILTER_NEAR_DUPLICATE_SIMILARITY", "0.6"))
+DEFAULT_MIN_ENGLISH_RATIO = 0.5  # Relaxed to include more posts
+# 12 bands of 3 rows: texts with a Jaccard similarity of 0.6 share a band with probability ~0.93
+BAND_ROWS = 3
+
+
+class PostPrefilter:
+    """
+    Cheap filter run on candidate posts before any of them is embedded. It keeps state across
+    the pages of one timeline and drops:
+    - posts that are not English,
+    - reblogs of an original that was already seen (the original is kept instead of the reblog),
+    - near-duplicates, i.e. texts whose estimated Jaccard similarity (MinHash) to an earlier one
+      reaches near_duplicate_similarity,
+    - posts beyond max_per_author per author.
+    Signatures are split into bands (locality-sensitive hashing), so a text is only compared
+    with the earlier texts it shares a band with.
+    """
+
+    def __init__(self, max_per_author: int = DEFAULT_MAX_PER_AUTHOR,
+                 near_duplicate_similarity: float = DEFAULT_NEAR_DUPLICATE_SIMILARITY,
+                 min_english_ratio: float = DEFAULT_MIN_ENGLISH_RATIO, seen=None):
+        """
+        :param max_per_author: Posts kept per author, 0 disables the cap.
+        :param near_duplicate_similarity: Estimated Jaccard similarity of the word bigrams from which
+                                          a text counts as a near-duplicate.
+        :param seen: Optional function(uri) telling whether a status was already seen, e.g. favourited.
+        """
+        self.max_per_author = max_per_author
+        self.near_duplicate_similarity = near_duplicate_similarity
+        self.min_english_ratio = min_english_ratio
+        self.seen = seen
+        self._bands = defaultdict(list)
+        self._seen_uris = set()
+        self._authors = Counter()
+        self.dropped = Counter()
+        self.saved_model_calls = Counter()
+
+    def filter(self, posts) -> list:
+        """
+        :return: (post, text) pairs of the posts worth embedding, reblogs replaced by their original
+                 and text the plain text of the post (see clean_html), so it is cleaned only once.
+        """
+        kept = []
+        for post in posts:
+            reason, text = self._drop_reason(post)
+            if reason is None:
+                kept.append((post.get("reblog") or post, text))
+            else:
+                self._count_drop(post.get("reblog") or post, reason)
+        return kept
+
+    def _drop_reason(self, post):
+        """
+        :return: Why the post is dropped (None if it is kept) and its plain text if it was computed.
+        """
+        original = post.get("reblog")
+        if original is not None:
+            if self._was_seen(original.get("uri")):
+                return "reblog", None
+            post = original
+        uri = post.get("uri")
+        if self._was_seen(uri):
+            return "duplicate", None
+
+        content = post.get("content", "").strip()
+        if post.get("language") != "en" or not content:
+            return "language", None
+        text = clean_html(content).strip()
+        if ascii_letter_ratio(text) <= self.min_english_ratio:
+            return "language", text
+
+        author = (post.get("account") or {}).get("acct")
+        if self.max_per_author and author is not None and self._authors[author] >= self.max_per_author:
+            return "author_cap", text
+        if self._is_near_duplicate(minhash(text)):
+            return "near_duplicate", text
+
+        if uri:
+            self._seen_uris.add(uri)
+        if author is not None:
+            self._authors[author] += 1
+        return None, text
+
+    def _was_seen(self, uri):
+        return bool(uri) and (uri in self._seen_uris or (self.seen is not None and self.seen(uri)))
+
+    def _is_near_duplicate(self, signature) -> bool:
+        bands = [
+            (start, signature[start:start + BAND_ROWS].tobytes())
+            for start in range(0, MINHASH_PERMUTATIONS, BAND_ROWS)
+        ]
+        compared = set()
+        for band in bands:
+            for other in self._bands.get(band, ()):
+                if id(other) not in compared:
+                    compared.add(id(other))
+                    if np.count_nonzero(signature == other) >= self.near_duplicate_similarity * len(signature):
+                        return True
+        for band in bands:
+            self._bands[band].append(signature)
+        return False
+
+    def _count_drop(self, post, reason):
+        self.dropped[reason] += 1
+        metrics.inc("mastoradar_prefilter_dropped_total", reason=reason)
+        # Model calls the post would have cost if it had been embedded; non-English posts were always skipped
+        if reason != "language":
+            n_images = len(parse_mastodon_post(post)["image_urls"])
+            self.saved_model_calls["text"] += 1
+            self.saved_model_calls["image"] += n_images
+            metrics.inc("mastoradar_prefilter_saved_model_calls_total", kind="text")
+            metrics.inc("mastoradar_prefilter_saved_model_calls_total", n_images, kind="image")
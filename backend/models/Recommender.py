@@ -1,178 +1,419 @@
 import numpy as np
-import re
-from sklearn.metrics.pairwise import cosine_similarity
-from concurrent.futures import ThreadPoolExecutor
+import heapq
+import logging
+import os
+import time
+from collections import Counter
 from .Embeddings import EmbeddingModel
-from utils.preprocessing import parse_mastodon_post
+from .EmbeddingStore import EmbeddingStore
+from .ImageFetcher import ImageFetcher, image_fetcher
+from .CandidateSources import CandidateSources, favourite_tags
+from .HybridRanker import HybridRanker, keyword_scores
+from .CandidateStore import CandidateStore
+from .Prefilter import DEFAULT_MIN_ENGLISH_RATIO, PostPrefilter
+from .UserProfile import UserProfile, ProfileStore
+from utils.preprocessing import ascii_letter_ratio, clean_html, parse_mastodon_post
+from utils.metrics import metrics
+from utils.similarity import combine_embeddings, score
+from utils.statuses import slim_status
 from mastodon import Mastodon
 from .KeywordExtractor import KeywordExtractor
+from .Registry import registry
+
+logger = logging.getLogger(__name__)
+
+# "centroid" scores by mean cosine similarity to the favourites, "clusters" by the best matching favourite cluster
+PROFILE_SCORING = os.getenv("PROFILE_SCORING", "centroid")
+# How the similarities to the cluster centroids are combined: max, mean, softmax or topm
+PROFILE_AGGREGATION = os.getenv("PROFILE_AGGREGATION", "max")
 
 class Recommender:
-    def __init__(self, mastodon: Mastodon):
+    def __init__(self, mastodon: Mastodon, embeddingModel: EmbeddingModel = None,
+                 keywordExtractor: KeywordExtractor = None, embeddingStore: EmbeddingStore = None,
+                 imageFetcher: ImageFetcher = None, profileStore: ProfileStore = None,
+                 profile: UserProfile = None, ranker: HybridRanker = None, user_key: str = None):
+        """
+        :param profile: The user's profile if it is already loaded, e.g. cached in their session.
+        :param user_key: Key of the user's profile if already known, saves an API call.
+        :param ranker: Scoring function of recommend, with its weight presets.
+        """
         self.mastodon = mastodon
-        self.embeddingModel = EmbeddingModel()
-        self.keywordExtractor = KeywordExtractor()
+        # Models are shared process-wide; loading them per request costs seconds and hundreds of MB
+        self.embeddingModel = embeddingModel if embeddingModel is not None else registry.get_embedding_model()
+        self.keywordExtractor = keywordExtractor if keywordExtractor is not None else registry.get_keyword_extractor()
+        # Per-request cache in front of the persistent store shared across requests, users and restarts
         self.embedding_cache = {}
+        self.embeddingStore = embeddingStore if embeddingStore is not None else registry.get_embedding_store()
+        self.imageFetcher = imageFetcher if imageFetcher is not None else image_fetcher
+        self.candidateSources = CandidateSources(mastodon)
+        self.favourites = None
+        self.profileStore = profileStore if profileStore is not None else registry.get_profile_store()
+        self.profile = profile
+        self.ranker = ranker if ranker is not None else HybridRanker()
+        self.user_key = user_key
+
+    def recommend(self, limit=1000, top_n=40, presets=None) -> dict:
+        """
+        Compute every kind of recommendations in a single pass: favourites and candidates are
+        fetched, filtered and embedded once, keywords are extracted for the same candidates, and
+        the HybridRanker ranks them with each weight preset. Candidates without an embedding only
+        take part in presets not requiring one, e.g. keyword recommendations.
+        :param presets: Names of the ranker's weight presets to rank with, all of them by default.
+        :return: Dictionary of preset -> recommended posts, as slim statuses (utils.statuses).
+        """
+        presets = list(presets or self.ranker.presets)
+        profile = self._update_profile()
+        prefilter = PostPrefilter(seen=profile.is_seen)
+        candidates = CandidateStore(self.embeddingModel.dim, limit)
+        # Posts without an embedding are kept: they can still be keyword recommendations
+        pages = self._filter_stage(self._fetch_stage(limit, None), prefilter)
+        for embedded in self._embed_stage(pages, keep_unembedded=True):
+            self._store(candidates, embedded)
+        if not len(candidates):
+            return {preset: [] for preset in presets}
+
+        favourites = self._get_favourites()
+        likedKeywords = Counter(keyword for keywords in self.__extractKeywords(favourites) for keyword in keywords)
+        likedTags = Counter(tag.lower() for post in favourites for tag in parse_mastodon_post(post)["tags"])
+        postKeywords = self.__extractKeywords(candidates.statuses(), candidates.texts())
+        queries = None
+        if profile.centroid is not None:
+            queries = profile.centroids if PROFILE_SCORING == "clusters" else profile.centroid[None, :]
+
+        with metrics.span("rank", "hybrid"):
+            features = self.ranker.features(
+                candidates, queries, PROFILE_AGGREGATION, postKeywords, likedKeywords, likedTags
+            )
+            return {preset: candidates.statuses(self.ranker.rank(features, preset, top_n)) for preset in presets}
 
-    def get_similar_posts(self, limit=1000, top_n=40):
+    def get_similar_posts(self, limit=1000, top_n=40, time_budget=None):
         """
         Fetch and recommend similar posts based on user favorites.
         :param limit: Number of public posts to analyze.
         :param top_n: Number of recommendations to return.
+        :param time_budget: Seconds after which the best recommendations found so far are returned.
+        :return: Recommended posts as slim statuses (utils.statuses), like KeywordRecommender.
         """
-        # Fetch favorited posts
-        favorited_posts = self.mastodon.favourites()
+        recommendations = []
+        for recommendations, _ in self.iter_similar_posts(limit, top_n, time_budget):
+            pass
+        return recommendations
+
+    def iter_similar_posts(self, limit=1000, top_n=40, time_budget=None):
+        """
+        Streaming version of get_similar_posts. Pages flow through fetch -> filter -> embed -> score
+        while later pages are still being fetched, and a running top-k heap is yielded whenever it changes.
+        :param time_budget: Seconds after which no more pages are processed.
+        :return: Generator of (recommendations, done) tuples with slim statuses; the last one has done=True.
+        """
+        deadline = None if time_budget is None else time.monotonic() + time_budget
 
-        # Fetch and filter public posts
-        public_posts = self._fetch_public_posts(limit)
-        public_posts = self._filter_posts(public_posts)
+        # Fold new favourites into the user's preference profile
+        profile = self._update_profile()
+        if profile.centroid is None:
+            yield [], True
+            return
+        queries = profile.centroids if PROFILE_SCORING == "clusters" else profile.centroid[None, :]
 
-        # Generate embeddings for favorited and public posts
-        favorite_embeddings = self._generate_favorite_embeddings(favorited_posts)
-        public_embeddings = self._generate_public_embeddings(public_posts)
+        # Append the embeddings to the candidate store as they arrive and keep the best rows in a heap
+        candidates = CandidateStore(self.embeddingModel.dim, limit)
+        best = []
+        prefilter = PostPrefilter(seen=profile.is_seen)
+        for embedded in self._embed_stage(self._filter_stage(self._fetch_stage(limit, deadline), prefilter)):
+            with metrics.span("score", "recommender"):
+                rows = self._store(candidates, embedded)
+                scores = score(candidates.embeddings[rows[0]:rows[-1] + 1], queries, PROFILE_AGGREGATION)
+                changed = False
+                for row, candidate_score in zip(rows.tolist(), scores):
+                    if len(best) < top_n:
+                        heapq.heappush(best, (candidate_score, row))
+                        changed = True
+                    elif candidate_score > best[0][0]:
+                        heapq.heapreplace(best, (candidate_score, row))
+                        changed = True
+            if changed:
+                yield candidates.statuses(row for _, row in sorted(best, reverse=True)), False
+        logger.debug(
+            "Scored %d candidate posts, prefilter dropped %s and saved %s model calls",
+            len(candidates), dict(prefilter.dropped), dict(prefilter.saved_model_calls),
+        )
+
+        # The heap holds the exact top-k over every scored candidate
+        yield candidates.statuses(row for _, row in sorted(best, reverse=True)), True
+
+    def _fetch_stage(self, limit, deadline):
+        """
+        Yield timeline pages as they arrive, stopping once the deadline has passed.
+        """
+        for page in self.candidateSources.iter_pages(limit, self._favourite_tags()):
+            yield page
+            if deadline is not None and time.monotonic() > deadline:
+                logger.info("Time budget exhausted, returning the best recommendations so far")
+                return
 
-        # Compute similarities and return recommendations
-        recommendations = self._compute_similarities(favorite_embeddings, public_embeddings)
-        return recommendations[:top_n]
+    def _filter_stage(self, pages, prefilter=None):
+        prefilter = prefilter if prefilter is not None else PostPrefilter()
+        for page in pages:
+            filtered = self._filter_posts(page, prefilter)
+            if filtered:
+                yield filtered
+
+    def _store(self, candidates, embedded):
+        """
+        Append a page of (post, text, embedding) entries to the candidate store.
+        :return: The rows the posts were stored at.
+        """
+        return candidates.add(
+            [post for post, _, _ in embedded], [emb for _, _, emb in embedded], [text for _, text, _ in embedded]
+        )
+
+    def _embed_stage(self, pages, keep_unembedded=False):
+        """
+        Embed pages of (post, text) pairs from the filter stage, yielding (post, text, embedding) entries.
+        """
+        for page in pages:
+            posts = [post for post, _ in page]
+            texts = [text for _, text in page]
+            embedded = [
+                (post, text, emb) for (post, emb), text in zip(self._generate_public_embeddings(posts, texts), texts)
+                if emb is not None or keep_unembedded
+            ]
+            if embedded:
+                yield embedded
+
+    @metrics.timed("profile", "recommender")
+    def _update_profile(self):
+        """
+        Load the user's persisted profile and fold in favourites that appeared since the last call.
+        Only new favourites are embedded.
+        """
+        profile = self.profile
+        if profile is None:
+            user_key = self._user_key()
+            profile = self.profileStore.get(user_key) or UserProfile(user_key)
+            self.profile = profile
+        new_favourites = [post for post in self._get_favourites() if not profile.is_seen(self._post_key(post))]
+        if new_favourites:
+            profile.update(dict(zip(map(self._post_key, new_favourites), self._embed_posts(new_favourites))))
+            self.profileStore.put(profile)
+        logger.debug("Profile built from %d favorites, %d new", profile.count, len(new_favourites))
+        return profile
+
+    def _user_key(self):
+        """
+        Identify the logged-in account, calling the API only if the key was not given.
+        """
+        if self.user_key is None:
+            account = self.mastodon.account_verify_credentials()
+            self.user_key = f"{getattr(self.mastodon, 'api_base_url', None)}|{account['id']}"
+        return self.user_key
+
+    def _get_favourites(self):
+        if self.favourites is None:
+            self.favourites = self.mastodon.favourites()
+        return self.favourites
+
+    def _favourite_tags(self):
+        """
+        Hashtags the user favourites most, seeding the hashtag candidate sources.
+        """
+        return favourite_tags(self._get_favourites())
 
     def _fetch_public_posts(self, limit):
         """
-        Fetch public posts up to the given limit using pagination.
-        """
-        posts = []
-        max_id = None
-        while len(posts) < limit:
-            batch = self.mastodon.timeline_local(max_id=max_id, limit=min(40, limit - len(posts)))
-            if not batch:
-                break
-            posts.extend(batch)
-            max_id = batch[-1]["id"]
-        return posts
-
-    def _filter_posts(self, posts):
-        """
-        Filter posts to ensure they are in English and do not contain duplicate content.
-        """
-        seen_content = set()
-        filtered_posts = []
-        for post in posts:
-            content = post.get("content", "").strip()
-            if post.get("language") == "en" and content and content not in seen_content:
-                clean_content = self._remove_urls(content)
-                if self._is_valid_english(clean_content):
-                    seen_content.add(content)
-                    filtered_posts.append(post)
-        # Log filtered count for debugging
-        print(f"Filtered posts count: {len(filtered_posts)}")
-        return filtered_posts
+        Fetch candidate posts up to the given limit from the local, public, trending and
+        favourite hashtag timelines, incrementally refreshing the cached timelines.
+        """
+        return self.candidateSources.fetch(limit, self._favourite_tags())
 
-    def _is_valid_english(self, text):
+    @metrics.timed("filter", "recommender")
+    def _filter_posts(self, posts, prefilter=None):
         """
-        Check if a text is predominantly in English using heuristic rules.
+        Filter posts to ensure they are in English and are not reblogs or near-duplicates of posts
+        already seen, capping the posts per author.
+        :param prefilter: PostPrefilter shared when filtering a timeline page by page.
+        :return: (post, text) pairs of the kept posts, text being the plain text of the post.
         """
-        if not text:
-            return False
-        english_ratio = sum(1 for char in text if char.isalpha() and char.isascii()) / len(text)
-        return english_ratio > 0.5  # Relaxed to include more posts
+        prefilter = prefilter if prefilter is not None else PostPrefilter()
+        return prefilter.filter(posts)
 
-    def _generate_favorite_embeddings(self, favorited_posts):
+    def _is_valid_english(self, text):
         """
-        Generate embeddings for favorited posts.
+        Check if a text is predominantly in English using heuristic rules.
         """
-        embeddings = [
-            self._get_or_compute_embedding(post)
-            for post in favorited_posts if self._get_or_compute_embedding(post) is not None
-        ]
-        print(f"Generated {len(embeddings)} favorite embeddings")  # Debugging
-        return embeddings
+        return ascii_letter_ratio(text) > DEFAULT_MIN_ENGLISH_RATIO
 
-    def _generate_public_embeddings(self, public_posts):
+    def _generate_public_embeddings(self, public_posts, texts=None):
         """
-        Generate embeddings for public posts using parallel computation.
+        Generate embeddings for public posts using batched model calls.
         """
-        with ThreadPoolExecutor(max_workers=8) as executor:
-            embeddings = list(executor.map(
-                lambda post: (post, self._get_or_compute_embedding(post)),
-                public_posts
-            ))
-        print(f"Generated {len(embeddings)} public embeddings")  # Debugging
-        return embeddings
+        return list(zip(public_posts, self._embed_posts(public_posts, texts)))
 
     def _get_or_compute_embedding(self, post):
         """
         Compute or retrieve cached embedding for a post.
         """
-        post_id = post["id"]
-        if post_id in self.embedding_cache:
-            return self.embedding_cache[post_id]
+        return self._embed_posts([post])[0]
 
-        data = parse_mastodon_post(post)
-        clean_text = self._remove_urls(data["text"]) if data["text"] else None
+    @metrics.timed("embed", "recommender")
+    def _embed_posts(self, posts, texts=None):
+        """
+        Compute or retrieve cached embeddings for many posts at once.
+        Texts and images of all uncached posts are embedded in batched forward passes,
+        images are downloaded concurrently beforehand.
+        :param texts: Plain text of each post, e.g. kept by the prefilter; cleaned here if not given.
+        :return: List of combined embeddings (or None) aligned with posts.
+        """
+        keys = [self._post_key(post) for post in posts]
+        self._load_cached(keys, "post")
+
+        pending = {}
+        texts_to_embed = {}
+        for position, (key, post) in enumerate(zip(keys, posts)):
+            if key not in self.embedding_cache and key not in pending:
+                pending[key] = parse_mastodon_post(post)
+                text = self._post_text(post) if texts is None or texts[position] is None else texts[position]
+                if text:
+                    texts_to_embed[key] = text
+
+        if pending:
+            text_embs = dict(zip(
+                texts_to_embed, self.embeddingModel.generate_text_embeddings(list(texts_to_embed.values()))
+            ))
 
-        # Generate embeddings
-        text_emb = self.embeddingModel.generate_text_embedding(clean_text) if clean_text else None
-        img_embs = [self.embeddingModel.generate_image_embedding(url) for url in data["media_urls"]]
-        combined_emb = self._combine_embeddings(text_emb, img_embs)
+            image_embs = self._embed_images([url for data in pending.values() for url in data["image_urls"]])
 
-        # Cache embedding
-        self.embedding_cache[post_id] = combined_emb
-        return combined_emb
+            persisted = {}
+            for key, data in pending.items():
+                img_embs = [image_embs[url] for url in data["image_urls"] if url in image_embs]
+                self.embedding_cache[key] = self._combine_embeddings(text_embs.get(key), img_embs)
+                # Don't persist embeddings missing an image that failed to download, retry them next time
+                if len(img_embs) == len(data["image_urls"]):
+                    persisted[key] = self.embedding_cache[key]
+            self.embeddingStore.put_many(self.embeddingModel.model_name, persisted)
 
-    def _remove_urls(self, text):
+        return [self.embedding_cache[key] for key in keys]
+
+    def _post_key(self, post):
         """
-        Remove URLs from a text string.
+        Key embeddings by status URI, which is stable across instances, falling back to the local id.
         """
-        return re.sub(r'http\S+', '', text).strip()
+        return post.get("uri") or str(post["id"])
 
-    def _combine_embeddings(self, text_embedding=None, image_embeddings=[]):
+    def _load_cached(self, keys, kind):
         """
-        Combine text and image embeddings into a single vector.
+        Load the embeddings of keys missing from the per-request cache from the persistent store.
+        :param kind: What the keys identify (post, media URL or image content), for the cache metrics.
         """
-        embeddings = []
-        if text_embedding is not None:
-            embeddings.append(text_embedding / np.linalg.norm(text_embedding))
-        embeddings.extend(img / np.linalg.norm(img) for img in image_embeddings if np.linalg.norm(img) > 0)
-        return np.mean(embeddings, axis=0) if embeddings else None
+        unique_keys = dict.fromkeys(keys)
+        missing = [key for key in unique_keys if key not in self.embedding_cache]
+        metrics.inc(
+            "mastoradar_embedding_cache_total", len(unique_keys) - len(missing), kind=kind, layer="memory", result="hit"
+        )
+        if missing:
+            stored = self.embeddingStore.get_many(self.embeddingModel.model_name, missing)
+            metrics.inc("mastoradar_embedding_cache_total", len(stored), kind=kind, layer="store", result="hit")
+            metrics.inc(
+                "mastoradar_embedding_cache_total", len(missing) - len(stored), kind=kind, layer="store", result="miss"
+            )
+            self.embedding_cache.update(stored)
 
-    def _compute_similarities(self, favorite_embeddings, public_embeddings):
+    def _embed_images(self, image_urls):
         """
-        Compute cosine similarities between favorite and public embeddings.
+        Embed images, reusing embeddings cached by media URL (Mastodon media URLs are immutable),
+        which saves the download, and by content hash, which saves decoding and the model call for
+        the same image under another URL (e.g. re-uploads).
+        The remaining images are downloaded concurrently, decoded at reduced size, preprocessed once
+        per distinct content and embedded in batches.
+        :return: Dictionary of url -> embedding for every image that could be embedded.
         """
-        public_data = [(post, emb) for post, emb in public_embeddings if emb is not None]
-        public_posts, public_embeds = zip(*public_data) if public_data else ([], [])
-        public_embeds = np.array(public_embeds)
+        url_keys = {url: f"media:{url}" for url in image_urls}
+        self._load_cached(url_keys.values(), "media")
+        embeddings = {url: self.embedding_cache[key] for url, key in url_keys.items() if key in self.embedding_cache}
 
-        # Compute cosine similarity
-        scores = cosine_similarity(public_embeds, favorite_embeddings).mean(axis=1)
+        fetched = {
+            url: result for url, result in self.imageFetcher.fetch_many(
+                [url for url in url_keys if url not in embeddings]
+            ).items() if result
+        }
+        content_keys = {digest: f"image:{digest}" for digest, _ in fetched.values()}
+        self._load_cached(content_keys.values(), "image")
+        metrics.inc("mastoradar_image_dedup_total", len(fetched) - len(content_keys))
 
-        # Rank posts by similarity score
-        recommendations = sorted(zip(public_posts, scores), key=lambda x: x[1], reverse=True)
-        return [post for post, _ in recommendations]
+        pixels = {}
+        for digest, data in fetched.values():
+            if content_keys[digest] not in self.embedding_cache and digest not in pixels:
+                try:
+                    pixels[digest] = self.embeddingModel.preprocess_image(self.embeddingModel.decode_image(data))
+                except Exception as e:
+                    logger.warning("Skipping undecodable image %s: %s", digest, e)
+                    pixels[digest] = None
+        digests = [digest for digest, image in pixels.items() if image is not None]
+        persisted = {}
+        new_embeddings = self.embeddingModel.generate_image_embeddings([pixels[digest] for digest in digests])
+        for digest, embedding in zip(digests, new_embeddings):
+            self.embedding_cache[content_keys[digest]] = persisted[content_keys[digest]] = embedding
+
+        for url, (digest, _) in fetched.items():
+            embedding = self.embedding_cache.get(content_keys[digest])
+            if embedding is not None:
+                embeddings[url] = self.embedding_cache[url_keys[url]] = persisted[url_keys[url]] = embedding
+        self.embeddingStore.put_many(self.embeddingModel.model_name, persisted)
+        return embeddings
+
+    def _post_text(self, post):
+        """
+        Plain text of a post for CLIP and keyword extraction: HTML tags and URLs take up the
+        text encoder's 77 tokens without telling anything about the topic.
+        """
+        return clean_html(post.get("content") or "").strip()
+
+    def _combine_embeddings(self, text_embedding=None, image_embeddings=[]):
+        """
+        Combine text and image embeddings into a single vector.
+        """
+        return combine_embeddings(text_embedding, image_embeddings)
 
 # Keyword Recommender
 
     def KeywordRecommender(self, limit=1000, top_n=40) -> list:
-        recommendations = []
-        userLikes = self.mastodon.favourites()
-        likedKeywords = self.__extractKeywords(userLikes)
+        """
+        Recommend public posts sharing keywords with the user's favourites.
+        Posts are ranked by weighted keyword overlap: each shared keyword counts as often as it
+        occurs in the favourites, scaled down for keywords that are common across the timeline.
+        :return: Recommended posts as slim statuses (utils.statuses), like get_similar_posts.
+        """
+        userLikes = self._get_favourites()
+        likedKeywords = Counter(keyword for keywords in self.__extractKeywords(userLikes) for keyword in keywords)
 
         # Fetch the public timeline with the specified number of pages
         publicTimeline = self._fetch_public_posts(limit)
+        postKeywords = self.__extractKeywords(publicTimeline)
 
-        # Add only new matches to avoid duplication
-        for post in publicTimeline:
-            if self.__postMatchesUserPreferences(post, likedKeywords) and post not in recommendations:
-                recommendations.append(post)
+        with metrics.span("rank", "keyword_recommender"):
+            scores = keyword_scores(postKeywords, likedKeywords)
 
-        return recommendations[:top_n]
-
-    def __extractKeywords(self, posts) -> list:
-        keywords = []
-        for post in posts:
-            content = post['content']
-            keywords.extend(self.keywordExtractor.extractKeywords(content))
-        return keywords
+        # Best matches first, timeline order among equal scores; skip duplicates of the same status
+        recommendations = []
+        seen = set()
+        for position in sorted(np.flatnonzero(scores), key=lambda p: (-scores[p], p)):
+            key = self._post_key(publicTimeline[position])
+            if key not in seen:
+                seen.add(key)
+                recommendations.append(slim_status(publicTimeline[position]))
+                if len(recommendations) == top_n:
+                    break
+        return recommendations
 
-    def __postMatchesUserPreferences(self, post, likedKeywords) -> bool:
-        postKeywords = self.__extractKeywords([post])
-        return any(keyword in postKeywords for keyword in likedKeywords)
+    @metrics.timed("extract_keywords", "keyword_recommender")
+    def __extractKeywords(self, posts, texts=None) -> list:
+        """
+        Extract the keywords of each post, reusing keywords cached by status URI.
+        :param texts: Plain text of each post, e.g. kept by the prefilter; cleaned here if not given.
+        :return: One set of keywords per post, in order.
+        """
+        keys = [self._post_key(post) for post in posts]
+        if texts is None:
+            texts = [self._post_text(post) for post in posts]
+        keywords = self.keywordExtractor.extractPostKeywords(dict(zip(keys, texts)))
+        return [set(keywords[key]) for key in keys]
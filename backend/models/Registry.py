@@ -0,0 +1,101 @@
+import threading
+import time
+from .Embeddings import EmbeddingModel
+from .EmbeddingStore import EmbeddingStore
+from .UserProfile import ProfileStore
+from .KeywordExtractor import KeywordExtractor
+from utils.memory import current_rss_bytes, peak_rss_bytes
+
+
+class ModelRegistry:
+    """
+    Process-wide holder for the heavy models (CLIP and spaCy).
+    Models are loaded once and shared by every request and every user.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._embedding_model = None
+        self._keyword_extractor = None
+        self._embedding_store = None
+        self._profile_store = None
+        self.load_seconds = {}
+        self.warmup_seconds = None
+
+    def get_embedding_model(self) -> EmbeddingModel:
+        """
+        Return the shared CLIP embedding model, loading it on first use.
+        """
+        if self._embedding_model is None:
+            with self._lock:
+                if self._embedding_model is None:
+                    self._embedding_model = self._timed_load("embedding_model", EmbeddingModel)
+        return self._embedding_model
+
+    def get_keyword_extractor(self) -> KeywordExtractor:
+        """
+        Return the shared spaCy/TextRank keyword extractor, loading it on first use.
+        """
+        if self._keyword_extractor is None:
+            with self._lock:
+                if self._keyword_extractor is None:
+                    self._keyword_extractor = self._timed_load("keyword_extractor", KeywordExtractor)
+        return self._keyword_extractor
+
+    def get_embedding_store(self) -> EmbeddingStore:
+        """
+        Return the shared persistent embedding store, opening it on first use.
+        """
+        if self._embedding_store is None:
+            with self._lock:
+                if self._embedding_store is None:
+                    self._embedding_store = EmbeddingStore()
+        return self._embedding_store
+
+    def get_profile_store(self) -> ProfileStore:
+        """
+        Return the shared persistent user profile store, opening it on first use.
+        """
+        if self._profile_store is None:
+            with self._lock:
+                if self._profile_store is None:
+                    self._profile_store = ProfileStore()
+        return self._profile_store
+
+    def _timed_load(self, name, factory):
+        start = time.perf_counter()
+        model = factory()
+        self.load_seconds[name] = time.perf_counter() - start
+        return model
+
+    def warm_up(self):
+        """
+        Load every model and run one dummy inference through each of them so the
+        first real request does not pay for lazy initialisation.
+        """
+        embedding_model = self.get_embedding_model()
+        keyword_extractor = self.get_keyword_extractor()
+        start = time.perf_counter()
+        embedding_model.generate_text_embedding("MastoRadar warm-up")
+        keyword_extractor.extractKeywords("MastoRadar warms up the keyword extraction pipeline.")
+        self.warmup_seconds = time.perf_counter() - start
+
+    def stats(self) -> dict:
+        """
+        Report which models are loaded, how long loading took and the process memory usage.
+        """
+        return {
+            "models_loaded": {
+                "embedding_model": self._embedding_model is not None,
+                "keyword_extractor": self._keyword_extractor is not None,
+            },
+            "clip_backend": self._embedding_model.backend.name if self._embedding_model is not None else None,
+            "embedding_store_entries": len(self._embedding_store) if self._embedding_store is not None else None,
+            "load_seconds": dict(self.load_seconds),
+            "warmup_seconds": self.warmup_seconds,
+            "rss_bytes": current_rss_bytes(),
+            "peak_rss_bytes": peak_rss_bytes(),
+        }
+
+
+registry = ModelRegistry()
@@ -0,0 +1,198 @@
+import os
+import queue
+import threading
+import time
+import logging
+from collections import OrderedDict
+from mastodon import Mastodon
+from utils.metrics import metrics
+
+PAGE_SIZE = 40  # Mastodon caps timeline pages at 40 statuses
+DEFAULT_CACHE_SIZE = int(os.getenv("TIMELINE_CACHE_SIZE", "2000"))
+DEFAULT_PREFETCH_PAGES = int(os.getenv("TIMELINE_PREFETCH_PAGES", "4"))
+DEFAULT_MIN_RATELIMIT_REMAINING = int(os.getenv("TIMELINE_MIN_RATELIMIT_REMAINING", "10"))
+DEFAULT_MAX_CACHED_TIMELINES = int(os.getenv("TIMELINE_CACHE_MAX_TIMELINES", "64"))
+# Timelines whose content does not depend on the user, cached once per instance
+SHARED_TIMELINES = ("local", "public", "trends")
+
+logger = logging.getLogger(__name__)
+
+# Posts already seen per (instance, access token or None for shared timelines, timeline), newest first,
+# shared by all fetchers; least recently used timelines are dropped beyond DEFAULT_MAX_CACHED_TIMELINES
+_timeline_cache = OrderedDict()
+_timeline_cache_lock = threading.Lock()
+
+
+def is_shared_timeline(timeline: str) -> bool:
+    return timeline in SHARED_TIMELINES or timeline.startswith("tag:")
+
+
+def purge_timeline_cache(access_token: str):
+    """
+    Drop the cached timelines specific to an access token, e.g. when its session is evicted.
+    """
+    with _timeline_cache_lock:
+        for key in [key for key in _timeline_cache if key[1] == access_token]:
+            del _timeline_cache[key]
+
+
+class TimelineFetcher:
+    """
+    Streams timeline pages from a background thread so callers can process one page
+    while the next one is in flight.
+    Repeat calls are incremental: only posts newer than the newest post seen last time are
+    requested (since_id), the rest is served from the shared timeline cache.
+    Works against any Mastodon-compatible server, including a local stub, through the given client.
+    """
+
+    def __init__(self, mastodon: Mastodon, timeline: str = "local", cache_size: int = DEFAULT_CACHE_SIZE,
+                 prefetch_pages: int = DEFAULT_PREFETCH_PAGES,
+                 min_ratelimit_remaining: int = DEFAULT_MIN_RATELIMIT_REMAINING):
+        """
+        :param timeline: "local", "public", "trends" or "tag:<hashtag>".
+        :param cache_size: Maximum number of posts kept per timeline for incremental refresh.
+        :param prefetch_pages: Number of pages fetched ahead of the consumer.
+        :param min_ratelimit_remaining: Pause until the rate-limit window resets below this many remaining calls.
+        """
+        self.mastodon = mastodon
+        self.timeline = timeline
+        self.cache_size = cache_size
+        self.prefetch_pages = prefetch_pages
+        self.min_ratelimit_remaining = min_ratelimit_remaining
+        self._cache_key = (
+            getattr(mastodon, "api_base_url", None),
+            None if is_shared_timeline(timeline) else getattr(mastodon, "access_token", None),
+            timeline,
+        )
+
+    def fetch(self, limit: int) -> list:
+        """
+        Fetch up to limit posts, newest first.
+        """
+        return [post for page in self.iter_pages(limit) for post in page]
+
+    def iter_pages(self, limit: int):
+        """
+        Yield pages of posts, newest first, until limit posts have been produced.
+        Pages are fetched ahead by a background thread while the caller processes earlier ones.
+        """
+        pages = queue.Queue(maxsize=self.prefetch_pages)
+        stop = threading.Event()
+        producer = threading.Thread(
+            target=self._produce, args=(limit, pages, stop), name=f"timeline-{self.timeline}", daemon=True
+        )
+        producer.start()
+        try:
+            while True:
+                item = pages.get()
+                if item is None:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            stop.set()
+
+    def _produce(self, limit, pages, stop):
+        def put(item):
+            # Give up if the consumer went away instead of blocking forever on a full queue
+            while not stop.is_set():
+                try:
+                    pages.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        try:
+            for page in self._pages(limit, stop):
+                if page and not put(page):
+                    return
+        except Exception as e:
+            put(e)
+            return
+        put(None)
+
+    def _pages(self, limit, stop):
+        if self.timeline == "trends":
+            # Trending statuses are ranked rather than chronological and only come as a single page
+            yield self._fetch_page(limit=min(PAGE_SIZE, limit))
+            return
+
+        with _timeline_cache_lock:
+            cached = list(_timeline_cache.get(self._cache_key, []))
+            if cached:
+                _timeline_cache.move_to_end(self._cache_key)
+        since_id = cached[0]["id"] if cached else None
+
+        # Newer posts than anything seen before, paginating backwards down to since_id
+        fresh = []
+        max_id = None
+        caught_up = False
+        while len(fresh) < limit and not stop.is_set():
+            batch = self._fetch_page(max_id=max_id, since_id=since_id, limit=min(PAGE_SIZE, limit - len(fresh)))
+            if not batch:
+                caught_up = True
+                break
+            fresh.extend(batch)
+            yield batch
+            max_id = batch[-1]["id"]
+
+        produced = fresh + cached[:max(0, limit - len(fresh))]
+        if len(fresh) < limit:
+            yield cached[:limit - len(fresh)]
+
+        # Older posts than the cache holds
+        max_id = produced[-1]["id"] if produced else None
+        older = []
+        while len(produced) + len(older) < limit and not stop.is_set():
+            batch = self._fetch_page(max_id=max_id, limit=min(PAGE_SIZE, limit - len(produced) - len(older)))
+            if not batch:
+                break
+            older.extend(batch)
+            yield batch
+            max_id = batch[-1]["id"]
+
+        # Only splice fresh posts onto the cache if nothing is missing between them
+        self._update_cache(fresh, older if caught_up else [], cached if caught_up else [])
+
+    def _update_cache(self, fresh, older, cached):
+        with _timeline_cache_lock:
+            current = _timeline_cache.get(self._cache_key, cached) if cached else []
+            seen = set()
+            merged = []
+            for post in fresh + current + older:
+                if post["id"] not in seen:
+                    seen.add(post["id"])
+                    merged.append(post)
+            _timeline_cache[self._cache_key] = merged[:self.cache_size]
+            _timeline_cache.move_to_end(self._cache_key)
+            while len(_timeline_cache) > DEFAULT_MAX_CACHED_TIMELINES:
+                _timeline_cache.popitem(last=False)
+
+    @metrics.timed("fetch_page", "timeline")
+    def _fetch_page(self, **kwargs):
+        self._respect_ratelimit()
+        if self.timeline == "local":
+            return self.mastodon.timeline_local(**kwargs)
+        if self.timeline == "public":
+            return self.mastodon.timeline_public(**kwargs)
+        if self.timeline == "trends":
+            return self.mastodon.trending_statuses(limit=kwargs.get("limit"))
+        if self.timeline.startswith("tag:"):
+            return self.mastodon.timeline_hashtag(self.timeline[len("tag:"):], **kwargs)
+        raise ValueError(f"Unknown timeline {self.timeline}")
+
+    def _respect_ratelimit(self):
+        """
+        Pause until the rate-limit window resets when few calls remain, based on the
+        X-RateLimit headers Mastodon.py records from the previous response.
+        """
+        remaining = getattr(self.mastodon, "ratelimit_remaining", None)
+        reset = getattr(self.mastodon, "ratelimit_reset", None)
+        if isinstance(remaining, (int, float)) and isinstance(reset, (int, float)) \
+                and remaining < self.min_ratelimit_remaining:
+            wait = reset - time.time()
+            if wait > 0:
+                logger.warning("Rate limit almost exhausted, waiting %.1fs", wait)
+                time.sleep(wait)
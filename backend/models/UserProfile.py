@@ -0,0 +1,142 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import numpy as np
+from utils.similarity import normalize
+
+DEFAULT_PROFILE_STORE_PATH = os.getenv(
+    "PROFILE_STORE_PATH", os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "profiles.sqlite3")
+)
+DEFAULT_N_CLUSTERS = int(os.getenv("PROFILE_CLUSTERS", "5"))
+MAX_SEEN_FAVOURITES = 2000
+
+
+class UserProfile:
+    """
+    Compact summary of a user's favourites: the mean of the normalised favourite embeddings
+    and a few online k-means cluster centroids. Folding in new favourites is incremental, so
+    scoring candidates never needs every favourite embedding again.
+    """
+
+    def __init__(self, user_key: str, n_clusters: int = DEFAULT_N_CLUSTERS):
+        self.user_key = user_key
+        self.n_clusters = n_clusters
+        self.total = None
+        self.count = 0
+        self.centroids = None
+        self.cluster_counts = np.empty(0, dtype=np.int64)
+        self.seen_favourites = []
+
+    @property
+    def centroid(self):
+        """
+        Mean of the normalised favourite embeddings; its inner product with a normalised
+        candidate equals the candidate's mean cosine similarity to the favourites.
+        """
+        return None if not self.count else self.total / self.count
+
+    def is_seen(self, key: str) -> bool:
+        return key in self._seen_set
+
+    @property
+    def seen_favourites(self):
+        return self._seen
+
+    @seen_favourites.setter
+    def seen_favourites(self, keys):
+        self._seen = list(keys)[-MAX_SEEN_FAVOURITES:]
+        self._seen_set = set(self._seen)
+
+    def update(self, favourites: dict):
+        """
+        Fold new favourites into the profile.
+        :param favourites: Dictionary of status key -> embedding (or None) for favourites not yet seen.
+        """
+        new_keys = [key for key in favourites if not self.is_seen(key)]
+        vectors = [favourites[key] for key in new_keys if favourites[key] is not None]
+        self.seen_favourites = self._seen + new_keys
+        if not vectors:
+            return
+        vectors = normalize(vectors)
+        if self.total is None:
+            self.total = np.zeros(vectors.shape[1], dtype=np.float32)
+            self.centroids = np.empty((0, vectors.shape[1]), dtype=np.float32)
+        self.total += vectors.sum(axis=0)
+        self.count += len(vectors)
+        for vector in vectors:
+            self._update_clusters(vector)
+
+    def _update_clusters(self, vector):
+        """
+        Sequential k-means: open a new cluster until n_clusters exist, then move the
+        nearest centroid towards the vector.
+        """
+        if len(self.centroids) < self.n_clusters:
+            self.centroids = np.vstack([self.centroids, vector])
+            self.cluster_counts = np.append(self.cluster_counts, 1)
+            return
+        nearest = int(np.argmax(self.centroids @ vector))
+        self.cluster_counts[nearest] += 1
+        self.centroids[nearest] += (vector - self.centroids[nearest]) / self.cluster_counts[nearest]
+
+    def to_record(self) -> tuple:
+        meta = {
+            "n_clusters": self.n_clusters,
+            "count": self.count,
+            "cluster_counts": self.cluster_counts.tolist(),
+            "seen_favourites": self._seen,
+            "dim": None if self.total is None else int(self.total.shape[0]),
+        }
+        vectors = b"" if self.total is None else np.vstack([self.total, self.centroids]).astype(np.float32).tobytes()
+        return json.dumps(meta), vectors
+
+    @classmethod
+    def from_record(cls, user_key: str, meta: str, vectors: bytes):
+        meta = json.loads(meta)
+        profile = cls(user_key, meta["n_clusters"])
+        profile.count = meta["count"]
+        profile.cluster_counts = np.asarray(meta["cluster_counts"], dtype=np.int64)
+        profile.seen_favourites = meta["seen_favourites"]
+        if meta["dim"] is not None:
+            matrix = np.frombuffer(vectors, dtype=np.float32).reshape(-1, meta["dim"]).copy()
+            profile.total, profile.centroids = matrix[0], matrix[1:]
+        return profile
+
+
+class ProfileStore:
+    """
+    Persists user profiles in a SQLite sidecar file so they survive restarts.
+    """
+
+    def __init__(self, path: str = DEFAULT_PROFILE_STORE_PATH):
+        self._lock = threading.Lock()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS profiles ("
+            " user_key TEXT PRIMARY KEY, meta TEXT NOT NULL, vectors BLOB NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, user_key: str):
+        """
+        Load a user's profile.
+        :return: The UserProfile, or None if the user has no stored profile.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT meta, vectors FROM profiles WHERE user_key = ?", (user_key,)
+            ).fetchone()
+        return UserProfile.from_record(user_key, *row) if row else None
+
+    def put(self, profile: UserProfile):
+        meta, vectors = profile.to_record()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO profiles VALUES (?, ?, ?, ?)", (profile.user_key, meta, vectors, time.time())
+            )
+            self._conn.commit()
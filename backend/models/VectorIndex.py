@@ -0,0 +1,134 @@
+"""
+Vector indexes over candidate embeddings. Recommendations are retrieved exactly: every candidate
+is scored by chunked matrix products (utils.similarity) against the rows of an ExactIndex.
+IVFIndex is an approximate alternative kept for experiments (benchmarks.bench_index); no
+serving path uses it.
+"""
+import numpy as np
+from utils.similarity import normalize, score, top_k
+
+
+class ExactIndex:
+    """
+    Brute-force cosine index. Vectors are normalised on insert and kept in a
+    preallocated float32 matrix that grows geometrically, so inserts are amortised O(1).
+    """
+
+    def __init__(self, dim: int, capacity: int = 1024):
+        self.dim = dim
+        self._vectors = np.empty((capacity, dim), dtype=np.float32)
+        self._ids = np.empty(capacity, dtype=np.int64)
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def vectors(self):
+        return self._vectors[:self._size]
+
+    @property
+    def ids(self):
+        return self._ids[:self._size]
+
+    def add(self, ids, vectors):
+        """
+        Insert vectors under the given integer ids.
+        """
+        vectors = normalize(vectors)
+        ids = np.asarray(ids, dtype=np.int64)
+        end = self._size + len(vectors)
+        if end > len(self._vectors):
+            capacity = max(end, 2 * len(self._vectors))
+            self._vectors = np.resize(self._vectors, (capacity, self.dim))
+            self._ids = np.resize(self._ids, capacity)
+        self._vectors[self._size:end] = vectors
+        self._ids[self._size:end] = ids
+        start, self._size = self._size, end
+        return np.arange(start, end)
+
+    def search(self, query, k: int):
+        """
+        Find the k stored vectors with the highest inner product with query.
+        :param query: A single query vector (not re-normalised, so a mean of unit vectors
+                      scores exactly like the mean cosine similarity).
+        :return: Tuple of (ids, scores), best first.
+        """
+        return self.search_many(np.atleast_2d(query), k)
+
+    def search_many(self, queries, k: int, aggregation: str = "max"):
+        """
+        Find the k stored vectors whose inner products with the queries, e.g. the cluster
+        centroids of a user profile, aggregate to the highest score.
+        :param aggregation: How the inner products are combined, see utils.similarity.aggregate.
+        :return: Tuple of (ids, scores), best first.
+        """
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        rows = self._candidate_rows(queries)
+        scores = score(self._vectors[rows], queries, aggregation)
+        best = top_k(scores, k)
+        return self._ids[rows][best], scores[best]
+
+    def _candidate_rows(self, queries):
+        return slice(0, self._size)
+
+
+class IVFIndex(ExactIndex):
+    """
+    Inverted-file approximate index: vectors are bucketed by their nearest k-means
+    centroid and a query only scans the n_probe most similar buckets.
+    Below min_train_size vectors it behaves like an exact index; it trains itself once
+    enough vectors have been inserted and assigns later inserts incrementally.
+    """
+
+    def __init__(self, dim: int, capacity: int = 1024, n_lists: int = None, n_probe: int = 8,
+                 min_train_size: int = 5000, seed: int = 0):
+        super().__init__(dim, capacity)
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.min_train_size = min_train_size
+        self.centroids = None
+        self._lists = None
+        self._rng = np.random.default_rng(seed)
+
+    def add(self, ids, vectors):
+        rows = super().add(ids, vectors)
+        if self.centroids is None:
+            if len(self) >= self.min_train_size:
+                self.train()
+        else:
+            self._assign(rows)
+        return rows
+
+    def train(self, iterations: int = 10):
+        """
+        Fit spherical k-means centroids on the stored vectors and rebuild the inverted lists.
+        """
+        data = self.vectors
+        n_lists = self.n_lists or max(1, int(np.sqrt(len(data))))
+        sample = data[self._rng.choice(len(data), size=min(len(data), n_lists * 64), replace=False)]
+        centroids = sample[self._rng.choice(len(sample), size=n_lists, replace=False)]
+        for _ in range(iterations):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, sample)
+            empty = ~sums.any(axis=1)
+            sums[empty] = centroids[empty]
+            centroids = normalize(sums)
+        self.centroids = centroids
+        self._lists = [np.empty(0, dtype=np.int64) for _ in range(n_lists)]
+        self._assign(np.arange(len(data)))
+
+    def _assign(self, rows):
+        assignment = np.argmax(self._vectors[rows] @ self.centroids.T, axis=1)
+        order = np.argsort(assignment, kind="stable")
+        buckets, starts = np.unique(assignment[order], return_index=True)
+        for bucket, members in zip(buckets, np.split(rows[order], starts[1:])):
+            self._lists[bucket] = np.concatenate([self._lists[bucket], members])
+
+    def _candidate_rows(self, queries):
+        if self.centroids is None:
+            return super()._candidate_rows(queries)
+        probes = np.unique(np.concatenate([top_k(self.centroids @ query, self.n_probe) for query in queries]))
+        return np.concatenate([self._lists[probe] for probe in probes])
+
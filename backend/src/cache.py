@@ -0,0 +1,68 @@
+import abc
+import os
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "10000"))
+
+
+class CacheBackend(abc.ABC):
+    """
+    Key-value cache shared by the request handlers. Instances behind a load balancer can share
+    recommendations by plugging in a networked implementation (e.g. Redis) with the same interface.
+    """
+
+    @abc.abstractmethod
+    def get(self, key: str):
+        """
+        :return: Cached value, or None if the key is missing or expired.
+        """
+
+    @abc.abstractmethod
+    def set(self, key: str, value, ttl: float = None):
+        """
+        :param ttl: Seconds after which the entry expires; None keeps it until it is evicted.
+        """
+
+    @abc.abstractmethod
+    def delete(self, key: str):
+        pass
+
+
+class LocalCacheBackend(CacheBackend):
+    """
+    In-process stand-in for a shared cache: a thread-safe LRU dictionary with optional expiry.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value, ttl: float = None):
+        expires_at = None if ttl is None else time.time() + ttl
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def __len__(self):
+        return len(self._entries)
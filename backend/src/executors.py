@@ -0,0 +1,81 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Saturated(Exception):
+    """Raised when an executor's queue is full; callers should retry after retry_after seconds."""
+
+    def __init__(self, name: str, retry_after: int):
+        super().__init__(f"The {name} executor is saturated, retry in {retry_after}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class BoundedExecutor:
+    """
+    Thread pool with admission control: at most max_workers tasks run and max_queue wait,
+    anything beyond that is rejected immediately with Saturated instead of piling up.
+    """
+
+    def __init__(self, name: str, max_workers: int, max_queue: int, retry_after: int):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.retry_after = retry_after
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self._pending = 0
+
+    @property
+    def pending(self):
+        return self._pending
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Schedule fn(*args, **kwargs) on the pool.
+        :return: A concurrent.futures.Future.
+        :raises Saturated: If max_workers + max_queue tasks are already pending.
+        """
+        with self._lock:
+            if self._pending >= self.max_workers + self.max_queue:
+                raise Saturated(self.name, self.retry_after)
+            self._pending += 1
+        try:
+            future = self._pool.submit(fn, *args, **kwargs)
+        except BaseException:
+            self._release(None)
+            raise
+        future.add_done_callback(self._release)
+        return future
+
+    def _release(self, _):
+        with self._lock:
+            self._pending -= 1
+
+    async def run(self, fn, *args, **kwargs):
+        """
+        Run a blocking function on the pool without blocking the event loop.
+        """
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+# Blocking Mastodon API calls
+io_executor = BoundedExecutor(
+    "io",
+    max_workers=int(os.getenv("IO_WORKERS", "16")),
+    max_queue=int(os.getenv("IO_QUEUE", "64")),
+    retry_after=int(os.getenv("IO_RETRY_AFTER", "1")),
+)
+
+# CLIP/spaCy recommendation computations; kept small because each one saturates the CPU
+inference_executor = BoundedExecutor(
+    "inference",
+    max_workers=int(os.getenv("INFERENCE_WORKERS", "2")),
+    max_queue=int(os.getenv("INFERENCE_QUEUE", "8")),
+    retry_after=int(os.getenv("INFERENCE_RETRY_AFTER", "30")),
+)
@@ -0,0 +1,195 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future
+from .cache import CacheBackend, LocalCacheBackend
+from .executors import BoundedExecutor, Saturated, inference_executor
+
+DEFAULT_TTL = float(os.getenv("RECOMMENDATION_TTL", "300"))
+DEFAULT_REFRESH_INTERVAL = float(os.getenv("RECOMMENDATION_REFRESH_INTERVAL", "60"))
+DEFAULT_IDLE_SECONDS = float(os.getenv("RECOMMENDATION_IDLE_SECONDS", "3600"))
+
+logger = logging.getLogger(__name__)
+
+
+class RecommendationCache:
+    """
+    Cache of ranked recommendation lists per (user, kind), remembering when each was computed.
+    Entries live in a CacheBackend, so instances sharing a backend serve each other's results.
+    """
+
+    def __init__(self, backend: CacheBackend = None):
+        self.backend = backend if backend is not None else LocalCacheBackend()
+
+    @staticmethod
+    def _key(key):
+        user_key, kind = key
+        return f"recommendations:{user_key}:{kind}"
+
+    def get(self, key):
+        """
+        :param key: Tuple of (user key, kind).
+        :return: Tuple of (value, age in seconds), or None if nothing was computed yet.
+        """
+        entry = self.backend.get(self._key(key))
+        if entry is None:
+            return None
+        value, computed_at = entry
+        return value, time.time() - computed_at
+
+    def set(self, key, value):
+        self.backend.set(self._key(key), (value, time.time()))
+
+    def delete_user(self, user_key, kinds):
+        for kind in kinds:
+            self.backend.delete(self._key((user_key, kind)))
+
+
+class RecommendationWorker:
+    """
+    Precomputes every active user's recommendations in the background.
+    Results are served from the cache with stale-while-revalidate semantics: a result older
+    than the TTL is still returned immediately while a refresh is scheduled. Only the very
+    first request of a user waits for a computation.
+    """
+
+    def __init__(self, computations: dict, cache: RecommendationCache = None, ttl: float = DEFAULT_TTL,
+                 refresh_interval: float = DEFAULT_REFRESH_INTERVAL, idle_seconds: float = DEFAULT_IDLE_SECONDS,
+                 executor: BoundedExecutor = inference_executor):
+        """
+        :param computations: Dictionary of kind -> function(session) computing that kind of recommendations.
+                             A tuple of kinds maps to one function computing all of them in a single
+                             pass and returning a dictionary of kind -> recommendations.
+        :param ttl: Age in seconds after which a result is refreshed.
+        :param refresh_interval: Seconds between background sweeps over the active users.
+        :param idle_seconds: Users who made no request for this long are no longer precomputed.
+        :param executor: Executor the computations run on.
+        """
+        self.computations = computations
+        # Kind -> key of the computation producing it
+        self._computation_of = {
+            kind: key for key in computations for kind in (key if isinstance(key, tuple) else (key,))
+        }
+        self.kinds = list(self._computation_of)
+        self.cache = cache or RecommendationCache()
+        self.ttl = ttl
+        self.refresh_interval = refresh_interval
+        self.idle_seconds = idle_seconds
+        self._executor = executor
+        self._lock = threading.Lock()
+        self._users = {}
+        self._in_flight = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="recommendation-worker", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def register(self, user_key, session):
+        """
+        Start precomputing recommendations for a logged-in user.
+        :param session: Object passed to the computations, holding the user's Mastodon client.
+        """
+        with self._lock:
+            self._users[user_key] = [session, time.time()]
+        self._refresh_stale(user_key)
+
+    def unregister(self, user_key):
+        with self._lock:
+            self._users.pop(user_key, None)
+        self.cache.delete_user(user_key, self.kinds)
+
+    def get(self, user_key, kind) -> Future:
+        """
+        Return a user's recommendations of the given kind.
+        :return: Future of (recommendations, age in seconds); already resolved when cached.
+        :raises Saturated: If nothing is cached and the executor cannot take another computation.
+        """
+        with self._lock:
+            if user_key not in self._users:
+                raise KeyError(user_key)
+            self._users[user_key][1] = time.time()
+        key = (user_key, kind)
+        result = Future()
+        cached = self.cache.get(key)
+        if cached is not None:
+            if cached[1] > self.ttl:
+                self._refresh_stale(user_key)
+            result.set_result(cached)
+            return result
+
+        def resolve(computation):
+            cached = self.cache.get(key)
+            if computation.exception() is not None:
+                result.set_exception(computation.exception())
+            elif cached is None:
+                result.set_exception(KeyError(user_key))  # Logged out while computing
+            else:
+                result.set_result(cached)
+
+        self.refresh(user_key, [kind]).add_done_callback(resolve)
+        return result
+
+    def refresh(self, user_key, kinds=None):
+        """
+        Schedule a recomputation of a user's recommendations; concurrent requests share one computation.
+        :return: Future of the last scheduled computation.
+        :raises Saturated: If the executor cannot take another computation.
+        """
+        future = None
+        computations = dict.fromkeys(self._computation_of[kind] for kind in kinds or self.kinds)
+        for computation in computations:
+            key = (user_key, computation)
+            with self._lock:
+                future = self._in_flight.get(key)
+                if future is None:
+                    future = self._executor.submit(self._compute, user_key, computation)
+                    self._in_flight[key] = future
+        return future
+
+    def _compute(self, user_key, computation):
+        try:
+            with self._lock:
+                user = self._users.get(user_key)
+            if user is not None:
+                result = self.computations[computation](user[0])
+                if isinstance(computation, tuple):
+                    for kind in computation:
+                        self.cache.set((user_key, kind), result[kind])
+                else:
+                    self.cache.set((user_key, computation), result)
+        except Exception:
+            logger.exception("Computing %s recommendations failed", computation)
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop((user_key, computation), None)
+
+    def _run(self):
+        while not self._stop.wait(self.refresh_interval):
+            now = time.time()
+            with self._lock:
+                active = [key for key, (_, last_seen) in self._users.items() if now - last_seen < self.idle_seconds]
+            for user_key in active:
+                self._refresh_stale(user_key)
+
+    def _refresh_stale(self, user_key):
+        stale = [
+            kind for kind in self.kinds
+            if (self.cache.get((user_key, kind)) or (None, float("inf")))[1] > self.ttl
+        ]
+        if stale:
+            try:
+                self.refresh(user_key, stale)
+            except Saturated:
+                pass  # Retried on the next sweep
@@ -0,0 +1,201 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+import requests
+from requests.adapters import HTTPAdapter
+from mastodon import Mastodon
+from models.Recommender import Recommender
+from models.TimelineFetcher import purge_timeline_cache
+from utils.memory import current_rss_bytes
+
+DEFAULT_MAX_SESSIONS = int(os.getenv("SESSION_MAX_SESSIONS", "1000"))
+DEFAULT_IDLE_SECONDS = float(os.getenv("SESSION_IDLE_SECONDS", "3600"))
+DEFAULT_MAX_RSS_MB = int(os.getenv("SESSION_MAX_RSS_MB", "0"))
+DEFAULT_PRESSURE_IDLE_SECONDS = float(os.getenv("SESSION_PRESSURE_IDLE_SECONDS", "60"))
+DEFAULT_POOL_SIZE = int(os.getenv("SESSION_POOL_SIZE", "4"))
+EVICTION_INTERVAL = 10
+
+logger = logging.getLogger(__name__)
+
+
+def token_key(access_token: str) -> str:
+    """
+    Identify a session by a hash of its access token, so raw tokens never end up in cache keys.
+    """
+    return hashlib.sha256(access_token.encode("utf-8")).hexdigest()
+
+
+class Session:
+    """
+    State kept for one logged-in user: a Mastodon client with its own pooled HTTP connections,
+    the account, the profile key and the preference profile, so they are not rebuilt on every request.
+    """
+
+    def __init__(self, access_token: str, api_base_url: str, pool_size: int = DEFAULT_POOL_SIZE):
+        self.key = token_key(access_token)
+        http = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        http.mount("https://", adapter)
+        http.mount("http://", adapter)
+        self.mastodon = Mastodon(access_token=access_token, api_base_url=api_base_url, session=http)
+        self.account = None
+        self.profile = None
+        self.user_key = None
+        self.last_used = time.time()
+        # Computations updating the profile of one user run one at a time, so favourites are folded in once
+        self._profile_lock = threading.Lock()
+
+    def touch(self):
+        self.last_used = time.time()
+
+    def verify_credentials(self):
+        """
+        :return: The user's account, fetched once per session.
+        """
+        if self.account is None:
+            self.account = self.mastodon.account_verify_credentials()
+        return self.account
+
+    def recommender(self) -> Recommender:
+        return Recommender(self.mastodon, profile=self.profile, user_key=self.user_key)
+
+    def _keep(self, recommender):
+        if recommender.profile is not None:
+            self.profile = recommender.profile
+        self.user_key = recommender.user_key
+
+    def recommend(self, **kwargs) -> dict:
+        """
+        Recommender.recommend, keeping the user's updated profile in the session.
+        """
+        with self._profile_lock:
+            recommender = self.recommender()
+            try:
+                return recommender.recommend(**kwargs)
+            finally:
+                self._keep(recommender)
+
+    def iter_similar_posts(self, **kwargs):
+        """
+        Recommender.iter_similar_posts, keeping the user's updated profile in the session.
+        """
+        with self._profile_lock:
+            recommender = self.recommender()
+            try:
+                yield from recommender.iter_similar_posts(**kwargs)
+            finally:
+                self._keep(recommender)
+
+    def close(self):
+        purge_timeline_cache(self.mastodon.access_token)
+        self.mastodon.session.close()
+
+
+class SessionManager:
+    """
+    Sessions of the logged-in users keyed by access token. Sessions idle for longer than
+    idle_seconds, the least recently used ones beyond max_sessions and, while the process uses
+    more than max_rss_mb, every session idle for longer than pressure_idle_seconds are evicted.
+    """
+
+    def __init__(self, api_base_url: str, max_sessions: int = DEFAULT_MAX_SESSIONS,
+                 idle_seconds: float = DEFAULT_IDLE_SECONDS, max_rss_mb: int = DEFAULT_MAX_RSS_MB,
+                 pressure_idle_seconds: float = DEFAULT_PRESSURE_IDLE_SECONDS,
+                 on_create=None, on_evict=None):
+        """
+        :param api_base_url: Mastodon instance the clients talk to.
+        :param max_rss_mb: Resident memory above which idle sessions are evicted early, 0 disables it.
+        :param on_create: Called with every new session.
+        :param on_evict: Called with every evicted or closed session.
+        """
+        self.api_base_url = api_base_url
+        self.max_sessions = max_sessions
+        self.idle_seconds = idle_seconds
+        self.max_rss_bytes = max_rss_mb * 1024 * 1024
+        self.pressure_idle_seconds = pressure_idle_seconds
+        self.on_create = on_create
+        self.on_evict = on_evict
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()
+        self._last_eviction = 0.0
+
+    def get(self, access_token: str) -> Session:
+        """
+        Return the session of an access token, creating it on first use. A new token is verified
+        against the instance before its session is kept, so invalid tokens are neither cached nor
+        handed to on_create.
+        :raises MastodonError: When the token cannot be verified.
+        """
+        key = token_key(access_token)
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is not None:
+                self._sessions.move_to_end(key)
+        created = session is None
+        if created:
+            session = self._verified(access_token)
+            with self._lock:
+                existing = self._sessions.get(key)
+                if existing is None:
+                    self._sessions[key] = session
+                else:
+                    # Another request verified the same token meanwhile; keep its session
+                    session.mastodon.session.close()
+                    session, created = existing, False
+                self._sessions.move_to_end(key)
+        session.touch()
+        if created and self.on_create is not None:
+            self.on_create(session)
+        self.evict()
+        return session
+
+    def _verified(self, access_token: str) -> Session:
+        session = Session(access_token, self.api_base_url)
+        try:
+            session.verify_credentials()
+        except Exception:
+            session.mastodon.session.close()
+            raise
+        return session
+
+    def close(self, access_token: str):
+        with self._lock:
+            session = self._sessions.pop(token_key(access_token), None)
+        if session is not None:
+            self._closed(session)
+
+    def evict(self, force: bool = False):
+        """
+        Drop idle sessions; runs at most every EVICTION_INTERVAL seconds unless forced.
+        """
+        now = time.time()
+        if not force and now - self._last_eviction < EVICTION_INTERVAL:
+            return
+        self._last_eviction = now
+        idle_seconds = self.idle_seconds
+        if self.max_rss_bytes and (current_rss_bytes() or 0) > self.max_rss_bytes:
+            idle_seconds = min(idle_seconds, self.pressure_idle_seconds)
+
+        evicted = []
+        with self._lock:
+            # Least recently used first
+            for key, session in list(self._sessions.items()):
+                if len(self._sessions) > self.max_sessions or now - session.last_used > idle_seconds:
+                    evicted.append(self._sessions.pop(key))
+                else:
+                    break
+        if evicted:
+            logger.info("Evicted %d idle sessions", len(evicted))
+        for session in evicted:
+            self._closed(session)
+
+    def _closed(self, session):
+        if self.on_evict is not None:
+            self.on_evict(session)
+        session.close()
+
+    def __len__(self):
+        return len(self._sessions)
@@ -0,0 +1,132 @@
+import pytest
+import models.TimelineFetcher as timeline_fetcher
+from benchmarks.fixtures import StatusGenerator, StubMastodon
+from models.TimelineFetcher import TimelineFetcher, purge_timeline_cache
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    timeline_fetcher._timeline_cache.clear()
+    yield
+    timeline_fetcher._timeline_cache.clear()
+
+
+def stub(n_posts=100, **kwargs):
+    generator = StatusGenerator(duplicate_ratio=0, seed=0)
+    client = StubMastodon(generator.timeline(n_posts), [], **kwargs)
+    client.generator = generator
+    return client
+
+
+def publish(client, n_posts):
+    """
+    Add n_posts newer than everything on the stub's timeline.
+    """
+    newest = client.posts[0]["id"]
+    client.posts = [client.generator.status(status_id) for status_id in range(newest + n_posts, newest, -1)] \
+        + client.posts
+
+
+def ids(posts):
+    return [post["id"] for post in posts]
+
+
+def test_first_fetch_pages_newest_first():
+    client = stub(100)
+    posts = TimelineFetcher(client, "local").fetch(90)
+    assert ids(posts) == ids(client.posts[:90])
+    assert client.calls == 3  # Pages of 40, 40 and 10
+
+
+def test_refresh_only_requests_newer_posts():
+    client = stub(100)
+    TimelineFetcher(client, "local").fetch(60)
+    publish(client, 5)
+    client.calls = 0
+
+    posts = TimelineFetcher(client, "local").fetch(60)
+    # The 5 new posts followed by the 55 newest cached ones, no gap and no duplicates
+    assert ids(posts) == ids(client.posts[:60])
+    # The new posts, then the empty page confirming nothing is missing before the cached ones
+    assert client.calls == 2
+
+
+def test_refresh_with_more_new_posts_than_a_page():
+    client = stub(100)
+    TimelineFetcher(client, "local").fetch(60)
+    publish(client, 50)
+
+    posts = TimelineFetcher(client, "local").fetch(60)
+    assert ids(posts) == ids(client.posts[:60])
+    # The cache is spliced in order: new posts first, then the previously cached ones
+    cached = timeline_fetcher._timeline_cache[(client.api_base_url, None, "local")]
+    assert ids(cached) == ids(client.posts[:110])
+
+
+def test_refresh_without_new_posts():
+    client = stub(100)
+    first = TimelineFetcher(client, "local").fetch(60)
+    client.calls = 0
+
+    second = TimelineFetcher(client, "local").fetch(60)
+    assert ids(second) == ids(first)
+    assert client.calls == 1  # The since_id request that comes back empty
+
+
+def test_refresh_fetches_older_posts_beyond_the_cache():
+    client = stub(100)
+    TimelineFetcher(client, "local").fetch(20)
+
+    posts = TimelineFetcher(client, "local").fetch(70)
+    assert ids(posts) == ids(client.posts[:70])
+
+
+def test_shared_timelines_are_cached_once_per_instance():
+    client = stub(100)
+    other_user = stub(100, access_token="other-token")
+    TimelineFetcher(client, "local").fetch(40)
+    other_user.posts = client.posts
+
+    TimelineFetcher(other_user, "local").fetch(40)
+    assert list(timeline_fetcher._timeline_cache) == [(client.api_base_url, None, "local")]
+    purge_timeline_cache(client.access_token)
+    assert len(timeline_fetcher._timeline_cache) == 1
+
+
+def test_cache_keeps_cache_size_posts_per_timeline():
+    client = stub(100)
+    TimelineFetcher(client, "local", cache_size=30).fetch(80)
+    assert ids(timeline_fetcher._timeline_cache[(client.api_base_url, None, "local")]) == ids(client.posts[:30])
+
+
+def test_least_recently_used_timelines_are_evicted(monkeypatch):
+    monkeypatch.setattr(timeline_fetcher, "DEFAULT_MAX_CACHED_TIMELINES", 2)
+    client = stub(100)
+    TimelineFetcher(client, "local").fetch(10)
+    TimelineFetcher(client, "public").fetch(10)
+    TimelineFetcher(client, "local").fetch(10)  # Reading marks the timeline as recently used
+    TimelineFetcher(client, "tag:python").fetch(10)
+
+    assert [key[2] for key in timeline_fetcher._timeline_cache] == ["local", "tag:python"]
+
+
+def test_waits_for_the_rate_limit_reset(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(timeline_fetcher.time, "sleep", sleeps.append)
+    client = stub(100)
+    client.ratelimit_remaining = 5
+    client.ratelimit_reset = timeline_fetcher.time.time() + 30
+
+    TimelineFetcher(client, "local", min_ratelimit_remaining=10).fetch(40)
+    assert len(sleeps) == 1 and 0 < sleeps[0] <= 30
+
+
+def test_does_not_wait_with_enough_calls_remaining(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(timeline_fetcher.time, "sleep", sleeps.append)
+    client = stub(100)
+    client.ratelimit_remaining = 50
+    client.ratelimit_reset = timeline_fetcher.time.time() + 30
+
+    TimelineFetcher(client, "local", min_ratelimit_remaining=10).fetch(40)
+    assert sleeps == []
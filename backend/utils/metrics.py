@@ -0,0 +1,147 @@
+import functools
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") != "0"
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{str(value)}"' for name, value in pairs) + "}"
+
+
+class Metrics:
+    """
+    Minimal thread-safe Prometheus-style metrics: counters, histograms and callback gauges,
+    rendered in the text exposition format.
+    """
+
+    def __init__(self, enabled: bool = METRICS_ENABLED, buckets=DEFAULT_BUCKETS):
+        self.enabled = enabled
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._help = {}
+        self._counters = {}
+        self._histograms = {}
+        self._gauges = {}
+
+    def describe(self, name: str, help_text: str):
+        self._help[name] = help_text
+
+    def inc(self, name: str, value: float = 1, **labels):
+        """
+        Increase a counter.
+        """
+        if not self.enabled:
+            return
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        """
+        Record one observation in a histogram.
+        """
+        if not self.enabled:
+            return
+        key = (name, _label_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram[0][i] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    def gauge(self, name: str, fn, help_text: str = None):
+        """
+        Register a gauge whose value is read from fn when metrics are rendered.
+        """
+        self._gauges[name] = fn
+        if help_text:
+            self.describe(name, help_text)
+
+    def span(self, stage: str, component: str):
+        """
+        Time a block of code into the mastoradar_stage_seconds histogram.
+        """
+        if not self.enabled:
+            return nullcontext()
+        return self._span(stage, component)
+
+    def timed(self, stage: str, component: str):
+        """
+        Decorator timing every call of a function as a span.
+        """
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.span(stage, component):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    @contextmanager
+    def _span(self, stage, component):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe("mastoradar_stage_seconds", time.perf_counter() - start, component=component, stage=stage)
+
+    def render(self) -> str:
+        """
+        Render every metric in the Prometheus text exposition format.
+        """
+        lines = []
+        typed = set()
+
+        def header(name, kind):
+            if name not in typed:
+                typed.add(name)
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, (list(h[0]), h[1], h[2])) for key, h in self._histograms.items())
+        for (name, labels), value in counters:
+            header(name, "counter")
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+        for (name, labels), (buckets, total, count) in histograms:
+            header(name, "histogram")
+            for bound, bucket_count in zip(self.buckets, buckets):
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {bucket_count}")
+            lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {count}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+        for name, fn in sorted(self._gauges.items()):
+            value = fn()
+            if value is not None:
+                header(name, "gauge")
+                lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+metrics.describe("mastoradar_stage_seconds", "Wall time spent per recommendation pipeline stage")
+metrics.describe("mastoradar_embedding_cache_total", "Embedding lookups by kind, cache layer and result")
+metrics.describe("mastoradar_embedded_items_total", "Texts and images run through the embedding model")
+metrics.describe("mastoradar_image_fetch_total", "Image downloads by result")
+metrics.describe("mastoradar_image_fetch_bytes_total", "Bytes of images downloaded")
+metrics.describe("mastoradar_image_dedup_total", "Downloaded images whose content was already downloaded in the same batch")
+metrics.describe("mastoradar_prefilter_dropped_total", "Candidate posts dropped before embedding, by reason")
+metrics.describe("mastoradar_prefilter_saved_model_calls_total", "Text and image embeddings avoided by the prefilter")
+metrics.describe("mastoradar_candidates_total", "Candidate posts fetched per source, unique or duplicate of another source")
@@ -1,3 +1,64 @@
+import html
+import os
+import re
+import numpy as np
+
+PREFER_IMAGE_PREVIEWS = os.getenv("PREFER_IMAGE_PREVIEWS", "1") != "0"
+# Images embedded per post, the first ones being the most representative; 0 embeds all of them
+MAX_IMAGES_PER_POST = int(os.getenv("MAX_IMAGES_PER_POST", "2"))
+
+_HTML_TAG = re.compile(r'<.*?>')
+_URL = re.compile(r'http\S+')
+_NOT_ASCII_LETTER = re.compile(r'[^A-Za-z]+')
+_TOKEN = re.compile(r'\w+')
+
+MINHASH_PERMUTATIONS = 36
+_MINHASH_PRIME = np.uint64(4294967311)  # Smallest prime above 2^32
+_MINHASH_A, _MINHASH_B = np.random.default_rng(1).integers(1, 2 ** 32, size=(2, 64), dtype=np.uint64)
+
+
+def clean_html(content: str) -> str:
+    """
+    Strip HTML tags and URLs from post content and unescape HTML entities.
+    """
+    clean_content = _HTML_TAG.sub('', content)  # Remove HTML tags
+    clean_content = _URL.sub('', clean_content)  # Remove URLs
+    return html.unescape(clean_content)
+
+
+def ascii_letter_ratio(text: str) -> float:
+    """
+    Fraction of the characters of a text that are ASCII letters, a cheap hint for English text.
+    """
+    if not text:
+        return 0.0
+    return len(_NOT_ASCII_LETTER.sub('', text)) / len(text)
+
+
+def shingles(text: str) -> set:
+    """
+    Lowercased word bigrams of a text (its words if it has fewer than two).
+    """
+    tokens = _TOKEN.findall(text.lower())
+    return set(" ".join(pair) for pair in zip(tokens, tokens[1:])) or set(tokens)
+
+
+def minhash(text: str, num_perm: int = MINHASH_PERMUTATIONS) -> np.ndarray:
+    """
+    MinHash signature of a text's shingles: the fraction of equal entries of two signatures
+    estimates the Jaccard similarity of the texts. Built on Python's string hash, so signatures
+    are only comparable within one process.
+    :return: uint64 array of num_perm minimum hashes, all equal to the prime for an empty text.
+    """
+    words = shingles(text)
+    if not words:
+        return np.full(num_perm, _MINHASH_PRIME, dtype=np.uint64)
+    hashes = np.array([hash(word) & 0xFFFFFFFF for word in words], dtype=np.uint64)
+    # Universal hashing (a * h + b) mod p, all operands below 2^32 so nothing overflows
+    permuted = (_MINHASH_A[:num_perm, None] * hashes[None, :] + _MINHASH_B[:num_perm, None]) % _MINHASH_PRIME
+    return permuted.min(axis=1)
+
+
 def parse_mastodon_post(post):
     """
     Extract relevant fields from a Mastodon post.
@@ -7,8 +68,12 @@ def parse_mastodon_post(post):
     # Extract text content
     text = post.get("content", "")
     # Extract image URLs from media attachments
-    media_urls = [
-        media["url"] for media in post.get("media_attachments", []) if media["type"] == "image"
+    images = [media for media in post.get("media_attachments", []) if media["type"] == "image"]
+    media_urls = [media["url"] for media in images]
+    # URLs to download for embedding: CLIP works at 224px, so the small preview is enough
+    image_urls = [
+        (media.get("preview_url") if PREFER_IMAGE_PREVIEWS else None) or media["url"]
+        for media in (images[:MAX_IMAGES_PER_POST] if MAX_IMAGES_PER_POST else images)
     ]
     # Extract hashtags
     tags = [tag["name"] for tag in post.get("tags", [])]
@@ -18,6 +83,7 @@ def parse_mastodon_post(post):
     return {
         "text": text,
         "media_urls": media_urls,
+        "image_urls": image_urls,
         "tags": tags,
         "sensitive": sensitive,
     }
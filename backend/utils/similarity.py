@@ -1,10 +1,92 @@
+import os
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
+
+AGGREGATIONS = ("mean", "max", "softmax", "topm")
+DEFAULT_CHUNK_SIZE = int(os.getenv("SIMILARITY_CHUNK_SIZE", "8192"))
+DEFAULT_TEMPERATURE = 0.05
+DEFAULT_TOP_M = 3
+
+
+def normalize(vectors):
+    """
+    L2-normalise row vectors as float32 so inner products are cosine similarities.
+    """
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def top_k(scores, k):
+    """
+    Return the indices of the k highest scores, best first, without sorting everything.
+    """
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k < len(scores):
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+def aggregate(similarities, aggregation: str = "max", temperature: float = DEFAULT_TEMPERATURE,
+              m: int = DEFAULT_TOP_M):
+    """
+    Reduce a (candidates x queries) similarity matrix to one score per candidate.
+    :param aggregation: "mean", "max", "softmax" (queries weighted by softmax(similarity / temperature),
+                        a smooth max) or "topm" (mean of the m best queries).
+    """
+    if aggregation == "max":
+        return similarities.max(axis=1)
+    if aggregation == "mean":
+        return similarities.mean(axis=1)
+    if aggregation == "softmax":
+        logits = similarities / temperature
+        weights = np.exp(logits - logits.max(axis=1, keepdims=True))
+        return (weights * similarities).sum(axis=1) / weights.sum(axis=1)
+    if aggregation == "topm":
+        m = min(m, similarities.shape[1])
+        return np.partition(similarities, -m, axis=1)[:, -m:].mean(axis=1)
+    raise ValueError(f"Unknown aggregation '{aggregation}', expected one of {', '.join(AGGREGATIONS)}")
+
+
+def score(candidates, queries, aggregation: str = "max", chunk_size: int = DEFAULT_CHUNK_SIZE, **kwargs):
+    """
+    Score every candidate against all queries with one matrix product per chunk of candidates,
+    so the similarity matrix held in memory is at most chunk_size x len(queries).
+    Both matrices are expected to be L2-normalised float32 rows.
+    :param candidates: Matrix of candidate vectors.
+    :param queries: Matrix of query vectors, e.g. favourite embeddings or profile centroids.
+    :param aggregation: How the similarities to the queries are combined, see aggregate.
+    :return: float32 array with one score per candidate.
+    """
+    candidates = np.atleast_2d(candidates)
+    queries = np.atleast_2d(queries)
+    if aggregation not in AGGREGATIONS:
+        raise ValueError(f"Unknown aggregation '{aggregation}', expected one of {', '.join(AGGREGATIONS)}")
+    scores = np.empty(len(candidates), dtype=np.float32)
+    for start in range(0, len(candidates), chunk_size):
+        chunk = candidates[start:start + chunk_size]
+        scores[start:start + len(chunk)] = aggregate(chunk @ queries.T, aggregation, **kwargs)
+    return scores
+
+
+def rank(candidates, queries, k: int, aggregation: str = "max", **kwargs):
+    """
+    Find the k candidates scoring highest against the queries.
+    :return: Tuple of (indices, scores), best first.
+    """
+    scores = score(candidates, queries, aggregation, **kwargs)
+    best = top_k(scores, k)
+    return best, scores[best]
 
 
 def combine_embeddings(text_embedding=None, image_embeddings=[]):
     """
     Combine text and image embeddings into a single vector.
+    Each embedding is normalised first so text and images weigh the same.
     :param text_embedding: Text embedding vector.
     :param image_embeddings: List of image embedding vectors.
     :return: Combined embedding vector or None if no embeddings exist.
@@ -13,23 +95,24 @@ def combine_embeddings(text_embedding=None, image_embeddings=[]):
     if text_embedding is not None:
         embeddings.append(text_embedding)
     embeddings.extend(image_embeddings)
-    return np.mean(embeddings, axis=0) if embeddings else None
+    embeddings = [embedding for embedding in embeddings if np.linalg.norm(embedding) > 0]
+    if not embeddings:
+        return None
+    return normalize(embeddings).mean(axis=0)
 
 
-def compute_similarity(favorite_embeddings, public_embeddings):
+def compute_similarity(favorite_embeddings, public_embeddings, aggregation: str = "max"):
     """
     Compute similarity scores between favorite embeddings and public embeddings.
     :param favorite_embeddings: List of embeddings for favorited posts.
     :param public_embeddings: List of tuples (post, embedding) for public posts.
+    :param aggregation: How the similarities to the favourites are combined, see aggregate.
     :return: List of dictionaries containing posts and their similarity scores.
     """
-    similarities = []
-    for post, public_embedding in public_embeddings:
-        if public_embedding is not None:
-            max_similarity = max(
-                cosine_similarity([public_embedding], [fav_emb])[0][0]
-                for fav_emb in favorite_embeddings
-            )
-            similarities.append({"post": post, "similarity": max_similarity})
-    return sorted(similarities, key=lambda x: x["similarity"], reverse=True)
-    
\ No newline at end of file
+    public_embeddings = [(post, embedding) for post, embedding in public_embeddings if embedding is not None]
+    if not public_embeddings or not len(favorite_embeddings):
+        return []
+    posts = [post for post, _ in public_embeddings]
+    scores = score(normalize([embedding for _, embedding in public_embeddings]),
+                   normalize(favorite_embeddings), aggregation)
+    return [{"post": posts[i], "similarity": float(scores[i])} for i in top_k(scores, len(scores))]
@@ -0,0 +1,54 @@
+import datetime
+
+
+def _timestamp(value):
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    return value
+
+
+def slim_account(account: dict) -> dict:
+    """
+    Keep only the account fields rendered next to a post.
+    """
+    account = account or {}
+    return {
+        "id": str(account.get("id", "")),
+        "username": account.get("username"),
+        "acct": account.get("acct"),
+        "display_name": account.get("display_name"),
+        "avatar": account.get("avatar"),
+        "url": account.get("url"),
+    }
+
+
+def slim_media(media: dict) -> dict:
+    return {
+        "type": media.get("type"),
+        "url": media.get("url"),
+        "preview_url": media.get("preview_url"),
+        "description": media.get("description"),
+    }
+
+
+def slim_status(status: dict) -> dict:
+    """
+    Reduce a Mastodon status (Mastodon.py object or raw API JSON) to the fields the frontend renders.
+    Reblogs are replaced by the boosted status, which is what the timeline shows.
+    :param status: Mastodon status.
+    :return: Compact, JSON-ready status.
+    """
+    status = status.get("reblog") or status
+    return {
+        "id": str(status.get("id", "")),
+        "uri": status.get("uri"),
+        "url": status.get("url"),
+        "created_at": _timestamp(status.get("created_at")),
+        "content": status.get("content", ""),
+        "account": slim_account(status.get("account")),
+        "media_attachments": [slim_media(media) for media in status.get("media_attachments") or []],
+    }
+
+
+def slim_statuses(statuses) -> list:
+    return [slim_status(status) for status in statuses or []]
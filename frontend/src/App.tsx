@@ -79,9 +79,15 @@ function App() {
   }, [currentPage]);
 
   
+  const authHeaders = (): Record<string, string> => {
+    const token = localStorage.getItem("access_token");
+    return token ? { "Authorization": `Bearer ${token}` } : {};
+  };
+
   const fetcher = async (endpoint: string) => {
     try {
       const response = await fetch(`http://127.0.0.1:8000${endpoint}`, {
+        headers: authHeaders(),
       });
       if (!response.ok) {
         throw new Error(`HTTP error! status: ${response.status}`);
@@ -146,11 +152,11 @@ function App() {
 
   const fetchUser = async (token: String) => {
     try {
-      const response = await fetch(`http://127.0.0.1:8000/getuser?access_token=${token}`, {
+      const response = await fetch(`http://127.0.0.1:8000/getuser`, {
         method: "GET",
         headers: {
           "Content-Type": "application/json",
-          "Authorization": `Bearer ${localStorage.getItem("access_token")}`
+          "Authorization": `Bearer ${token}`
         },
       });
       if (!response.ok) {
@@ -169,6 +175,7 @@ function App() {
         method: "POST",
         headers: {
           "Content-Type": "application/json",
+          ...authHeaders(),
         },
       });
   